@@ -1,22 +1,186 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, status
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from contextlib import asynccontextmanager
 import shutil
 import os
-import subprocess
 import logging
 import uuid
 import traceback
-import os
+import time
+import hashlib
+import json
+import asyncio
+import zipfile
+import re
+from typing import List
 from dotenv import load_dotenv
+from result_cache import ResultCache, hash_file
+from jobs import Job, JobQueue, QueueFullError
+from workers import WarmPool
+from node_selection import validate_selectors, SelectionError
+from compression import open_decompressed, negotiate, encoded_copy, encode_bytes, UnsupportedEncodingError
+from reaper import Reaper
+from metrics import Registry, MEMORY_BUCKETS, SIZE_BUCKETS
+from svg_render import FORMATS as IMAGE_FORMATS, MEDIA_TYPES
+from tile_store import store_meta, query_cells, TileStoreError, DEFAULT_LIMIT
 
 load_dotenv()
-app = FastAPI()
 
 # Логирование в stdout
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 API_TOKEN = os.environ.get("API_TOKEN")
 OUTPUT_DIR = "/output"
 TMP_DIR = "/tmp"
+# Каждый запрос получает свой рабочий каталог: одинаковые имена файлов не перезаписывают друг друга
+WORK_DIR = os.environ.get("WORK_DIR", os.path.join(TMP_DIR, "dbt-drawio"))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 1024 ** 3))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Очистка /output: результаты старше OUTPUT_MAX_AGE секунд, затем самые старые сверх OUTPUT_MAX_BYTES
+OUTPUT_MAX_AGE = int(os.environ.get("OUTPUT_MAX_AGE", 24 * 3600))
+OUTPUT_MAX_BYTES = int(os.environ.get("OUTPUT_MAX_BYTES", 10 * 1024 ** 3))
+REAPER_INTERVAL = int(os.environ.get("REAPER_INTERVAL", 300))
+# Сколько последних символов stderr генератора возвращать в ответах об ошибке
+STDERR_TAIL = 4000
+# Пакетная обработка: сколько манифестов за один вызов и сколько процессов на раскладку видов одного манифеста
+BATCH_MAX_MANIFESTS = int(os.environ.get("BATCH_MAX_MANIFESTS", 50))
+BATCH_LAYOUT_WORKERS = int(os.environ.get("BATCH_LAYOUT_WORKERS", 2))
+# Просмотрщик по областям: хранилище /output/<id>_tiles.sqlite и статическая страница
+TILES_NAME = "tiles.sqlite"
+TILES_ID_RE = re.compile(r"^[0-9a-f]{12}$")
+VIEWER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "viewer.html")
+LAYOUT_ENGINES = ("dot", "layered")
+PAGE_GROUPINGS = ("package", "folder")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+os.makedirs(WORK_DIR, exist_ok=True)
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(OUTPUT_DIR, ".cache"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 2 * 1024 ** 3))
+result_cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES)
+# Код генератора входит в ключ кэша, поэтому после деплоя схемы от старой версии не отдаются
+GENERATOR_MODULES = ("generate_scheme.py", "layered_layout.py", "compact_graph.py", "node_selection.py", "svg_render.py",
+                     "run_results.py", "tile_store.py")
+GENERATOR_FINGERPRINT = hashlib.sha256("".join(
+    hash_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), module)) for module in GENERATOR_MODULES
+).encode()).hexdigest()
+# Очередь задач: сколько генераций одновременно, сколько ждут, сколько секунд на одну
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", 2))
+JOB_QUEUE_DEPTH = int(os.environ.get("JOB_QUEUE_DEPTH", 16))
+JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", 600))
+# pool — тёплые процессы с уже импортированным generate_scheme; subprocess — новый интерпретатор на каждую задачу
+GENERATOR_MODE = os.environ.get("GENERATOR_MODE", "pool")
+WORKER_MAX_JOBS = int(os.environ.get("WORKER_MAX_JOBS", 50))
+# Метрики Prometheus (/metrics)
+metrics = Registry()
+HTTP_REQUESTS = metrics.counter("dbt_scheme_http_requests_total", "HTTP requests by route and status code",
+                                ("method", "route", "status"))
+HTTP_SECONDS = metrics.histogram("dbt_scheme_http_request_seconds", "HTTP request latency", ("method", "route"))
+JOBS = metrics.counter("dbt_scheme_jobs_total", "Finished generation jobs", ("status", "cache_hit"))
+JOB_QUEUE_SECONDS = metrics.histogram("dbt_scheme_job_queue_seconds", "Time a job waited in the queue")
+JOB_RUN_SECONDS = metrics.histogram("dbt_scheme_job_run_seconds", "Time a job spent running the generator")
+STAGE_SECONDS = metrics.histogram("dbt_scheme_stage_seconds", "Wall time per generator stage", ("stage",))
+STAGE_CPU_SECONDS = metrics.histogram("dbt_scheme_stage_cpu_seconds", "CPU time per generator stage", ("stage",))
+# В режиме пула это пик процесса-воркера за всё время его жизни, а не только последнего задания
+PEAK_RSS = metrics.histogram("dbt_scheme_generator_peak_rss_bytes", "Generator peak resident memory",
+                             buckets=MEMORY_BUCKETS)
+GRAPH_SIZE = metrics.histogram("dbt_scheme_graph_size", "Graph size per generated diagram", ("counter",),
+                               buckets=SIZE_BUCKETS)
+
+
+def observe_job(job):
+    JOBS.inc(status=job.status, cache_hit=str(job.cache_hit).lower())
+    if job.started_at:
+        JOB_QUEUE_SECONDS.observe(job.started_at - job.created_at)
+        JOB_RUN_SECONDS.observe(job.finished_at - job.started_at)
+    if not job.profile:
+        return
+    for stage, timing in job.profile["stages"].items():
+        STAGE_SECONDS.observe(timing["wall_seconds"], stage=stage)
+        STAGE_CPU_SECONDS.observe(timing["cpu_seconds"], stage=stage)
+    if job.profile.get("peak_rss_bytes"):
+        PEAK_RSS.observe(job.profile["peak_rss_bytes"])
+    for counter, value in job.profile["counters"].items():
+        GRAPH_SIZE.observe(value, counter=counter)
+
+
+def job_finished(job):
+    observe_job(job)
+    # Входной манифест больше не нужен, результат остаётся в /output до очистки
+    shutil.rmtree(os.path.dirname(job.input_path), ignore_errors=True)
+
+
+warm_pool = WarmPool(workers=JOB_CONCURRENCY, max_jobs_per_worker=WORKER_MAX_JOBS) if GENERATOR_MODE == "pool" else None
+job_queue = JobQueue(concurrency=JOB_CONCURRENCY, max_depth=JOB_QUEUE_DEPTH, timeout=JOB_TIMEOUT, pool=warm_pool,
+                     on_finish=job_finished)
+# Рабочие каталоги обычно удаляются сразу; здесь подчищаются оставшиеся после сбоев
+reapers = [Reaper(OUTPUT_DIR, OUTPUT_MAX_AGE, OUTPUT_MAX_BYTES, REAPER_INTERVAL),
+           Reaper(WORK_DIR, max(JOB_TIMEOUT * 2, 3600), interval=REAPER_INTERVAL)]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if warm_pool is not None:
+        warm_pool.start()
+    job_queue.start()
+    for reaper in reapers:
+        reaper.start()
+    yield
+    for reaper in reapers:
+        await reaper.stop()
+    await job_queue.stop()
+    if warm_pool is not None:
+        warm_pool.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+class UploadSizeLimit:
+    # ASGI-обёртка над receive: байты тела считаются по мере чтения, так что лимит действует и на
+    # chunked-загрузки без Content-Length, а multipart-парсер не успевает записать на диск больше лимита
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        detail = f"upload exceeds {self.max_bytes} bytes"
+        # Заведомо слишком большие тела отклоняем, не читая
+        content_length = Headers(scope=scope).get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, content={"detail": detail})
+            await response(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Поднимается при разборе формы; FastAPI передаёт HTTPException клиенту как есть
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(UploadSizeLimit, max_bytes=MAX_UPLOAD_BYTES)
+
+
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Шаблон маршрута, а не сырой путь: /jobs/{job_id} не раздувает число рядов
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else "unmatched"
+    HTTP_REQUESTS.inc(method=request.method, route=route_path, status=str(response.status_code))
+    HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route_path)
+    return response
 
 
 def verify_token(request: Request):
@@ -30,67 +194,216 @@ def verify_token(request: Request):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
 
+def verify_layout(layout):
+    if layout not in LAYOUT_ENGINES:
+        raise HTTPException(status_code=400, detail=f"layout must be one of: {', '.join(LAYOUT_ENGINES)}")
+
+
+def verify_selectors(select, exclude):
+    try:
+        validate_selectors(select)
+        validate_selectors(exclude)
+    except SelectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def generation_options(layout, compact, select, exclude, pages, compress, render=None, tiles=False):
+    verify_layout(layout)
+    verify_selectors(select, exclude)
+    if pages and pages not in PAGE_GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"pages must be one of: {', '.join(PAGE_GROUPINGS)}")
+    if render and render not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(IMAGE_FORMATS)}")
+    # Пробелы в селекторах не влияют на результат, поэтому нормализуем их для ключа кэша
+    return {"layout": layout, "compact": compact,
+            "select": " ".join(select.split()) if select else None,
+            "exclude": " ".join(exclude.split()) if exclude else None,
+            "pages": pages or None, "compress": compress, "render": render or None, "tiles": tiles}
+
+
+def parse_views(views):
+    # JSON-список видов для /batch: [{"name": "orders.xml", "select": "+orders", "exclude": ..., "pages": ...}]
+    if not views:
+        return [{"name": "raw_graph.xml"}]
+    try:
+        views = json.loads(views)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"views is not valid JSON: {e}")
+    if not isinstance(views, list) or not views or not all(isinstance(view, dict) for view in views):
+        raise HTTPException(status_code=400, detail="views must be a non-empty JSON list of objects")
+    names = set()
+    for view in views:
+        name = os.path.basename(str(view.get("name") or ""))
+        if not name or name in names:
+            raise HTTPException(status_code=400, detail=f"every view needs a unique name, got {view.get('name')!r}")
+        names.add(name)
+        verify_selectors(view.get("select"), view.get("exclude"))
+        if view.get("pages") not in (None, *PAGE_GROUPINGS):
+            raise HTTPException(status_code=400, detail=f"pages must be one of: {', '.join(PAGE_GROUPINGS)}")
+    return [{key: view[key] for key in ("name", "select", "exclude", "pages") if view.get(key)} for view in views]
+
+
+def request_paths(request_id, filename, out_name):
+    # Рабочий каталог запроса для входа, результат с префиксом request_id в /output
+    workdir = os.path.join(WORK_DIR, request_id)
+    os.makedirs(workdir)
+    input_name = os.path.basename(filename or "") or "manifest.json"
+    for suffix in (".gz", ".zst"):
+        input_name = input_name.removesuffix(suffix)  # сохраняется уже распакованная копия
+    input_path = os.path.join(workdir, input_name)
+    output_path = os.path.join(OUTPUT_DIR, f"{request_id}_{os.path.basename(out_name) or 'raw_graph.xml'}")
+    return input_path, output_path
+
+
+def save_upload(upload, input_path):
+    # Копируется частями с подсчётом хэша по ходу; gzip/zstd сначала распаковываются, поэтому генератор
+    # и ключ кэша видят обычный JSON, а лимит размера защищает и от zip-бомб
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        source = open_decompressed(upload.file)
+        with open(input_path, "wb") as buffer:
+            for chunk in iter(lambda: source.read(UPLOAD_CHUNK_BYTES), b""):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                        detail=f"manifest exceeds {MAX_UPLOAD_BYTES} bytes")
+                digest.update(chunk)
+                buffer.write(chunk)
+    except HTTPException:
+        shutil.rmtree(os.path.dirname(input_path), ignore_errors=True)
+        raise
+    except UnsupportedEncodingError as e:
+        shutil.rmtree(os.path.dirname(input_path), ignore_errors=True)
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+    except (OSError, EOFError) as e:
+        shutil.rmtree(os.path.dirname(input_path), ignore_errors=True)
+        raise HTTPException(status_code=400, detail=f"manifest could not be decompressed: {e}")
+    return digest.hexdigest()
+
+
+def run_summary_path(output_path):
+    return os.path.splitext(output_path)[0] + ".run_summary.json"
+
+
+def artifact_suffix(options):
+    # Расширение записи в кэше — по типу результата, а не по имени файла, выбранному клиентом
+    if options.get("tiles"):
+        return ".sqlite"
+    if options.get("render"):
+        return f".{options['render']}"
+    return ".xml"
+
+
+def cache_result(job):
+    result_cache.put(job.cache_key, job.output_path, artifact_suffix(job.options))
+    if job.options.get("run_summary"):
+        result_cache.put(f"{job.cache_key}-run-summary", job.options["run_summary"], ".json")
+
+
+def prepare_job(job_id, input_path, output_path, manifest_hash, options, run_results=None):
+    # Ключ кэша: содержимое манифеста (+ run_results) + параметры генерации.
+    # run_results: (путь, sha256) загруженного run_results.json; в ключ идёт только хэш
+    options = dict(options)
+    key_options = {**options, "generator": GENERATOR_FINGERPRINT}
+    if run_results:
+        key_options["run_results"] = run_results[1]
+    cache_key = result_cache.key(manifest_hash, key_options)
+    # seed из ключа кэша делает результат побайтно воспроизводимым
+    options["seed"] = int(cache_key[:8], 16)
+    if run_results:
+        options["run_results"] = run_results[0]
+        options["run_summary"] = run_summary_path(output_path)
+    job = Job(input_path, output_path, options, on_success=cache_result, job_id=job_id,
+              profile_path=os.path.join(os.path.dirname(input_path), "profile.json"))
+    job.cache_key = cache_key
+    cached_path = result_cache.get(cache_key, artifact_suffix(options))
+    cached_summary = result_cache.get(f"{cache_key}-run-summary", ".json") if run_results else None
+    if cached_path and (cached_summary or not run_results):
+        shutil.copyfile(cached_path, output_path)
+        if cached_summary:
+            shutil.copyfile(cached_summary, options["run_summary"])
+        job.cache_hit = True
+        logging.info(f"[{job_id}] Результат из кэша: {cache_key}")
+    return job
+
+
+def enqueue(job):
+    if job.cache_hit:
+        job.finish("done")
+        return job_queue.add_finished(job)
+    try:
+        return job_queue.submit(job)
+    except QueueFullError as e:
+        logging.warning(f"[{job.id}] Очередь заполнена: {e}")
+        shutil.rmtree(os.path.dirname(job.input_path), ignore_errors=True)
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e),
+                            headers={"Retry-After": "30"})
+
+
 @app.post("/process/")
 async def process_manifest(
         request: Request,
         manifest: UploadFile = File(...),
-        out_name: str = Form("raw_graph.xml")
+        out_name: str = Form("raw_graph.xml"),
+        layout: str = Form("dot"),
+        compact: bool = Form(False),
+        select: str = Form(None),
+        exclude: str = Form(None),
+        pages: str = Form(None),
+        compress: bool = Form(False),
+        run_results: UploadFile = File(None),
 ):
     verify_token(request)
+    options = generation_options(layout, compact, select, exclude, pages, compress)
     request_id = str(uuid.uuid4())[:8]
-    # input_path = os.path.join(TMP_DIR, f"{request_id}_{manifest.filename}")
-    input_path = os.path.join(TMP_DIR, f"{manifest.filename}")
-    # output_path = os.path.join(OUTPUT_DIR, f"{request_id}_{out_name}")
-    output_path = os.path.join(OUTPUT_DIR, f"{out_name}")
+    input_path, output_path = request_paths(request_id, manifest.filename, out_name)
 
     try:
         # Сохраняем входящий файл
-        with open(input_path, "wb") as buffer:
-            shutil.copyfileobj(manifest.file, buffer)
+        manifest_hash = await run_in_threadpool(save_upload, manifest, input_path)
         logging.info(f"[{request_id}] Получен файл: {input_path}")
+        # run_results.json (необязательно): время выполнения моделей, критический путь и узкие места
+        run_results_input = None
+        if run_results is not None:
+            run_results_path = os.path.join(os.path.dirname(input_path), "run_results.json")
+            run_results_input = (run_results_path, await run_in_threadpool(save_upload, run_results, run_results_path))
 
-        # Запуск обработки
-        cmd = ["python3", "generate_scheme.py", "--path", input_path, "--name", output_path]
-        logging.info(f"[{request_id}] Запуск команды: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
-
-        # Лог stdout/stderr
-        logging.info(f"[{request_id}] stdout: {result.stdout}")
-        logging.info(f"[{request_id}] stderr: {result.stderr}")
+        # Запуск обработки через общую очередь, не блокируя event loop
+        job = await run_in_threadpool(prepare_job, request_id, input_path, output_path, manifest_hash, options,
+                                      run_results_input)
+        enqueue(job)
+        await job.done.wait()
 
-        if result.returncode != 0:
-            logging.error(f"[{request_id}] Ошибка генерации, code={result.returncode}")
+        if job.status != "done":
+            logging.error(f"[{request_id}] Ошибка генерации: {job.error}")
             raise HTTPException(
                 status_code=500,
                 detail={
                     "request_id": request_id,
                     "error": "Обработка завершилась ошибкой",
-                    "stderr": result.stderr,
-                }
-            )
-
-        # Проверяем, что файл создан
-        if not os.path.exists(output_path):
-            logging.error(f"[{request_id}] Файл результата не найден: {output_path}")
-            raise HTTPException(
-                status_code=500,
-                detail={
-                    "request_id": request_id,
-                    "error": "Файл результата не создан",
+                    "reason": job.error,
+                    "stderr": job.stderr[-STDERR_TAIL:],
                 }
             )
 
         logging.info(f"[{request_id}] Успешно обработано. Результат: {output_path}")
 
-        return {
+        # Пути на сервере и логи генератора клиенту не нужны: результат скачивается по result_url
+        response = {
             "request_id": request_id,
             "status": "success",
-            "input_file": input_path,
-            "output_file": output_path,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
+            "cache_hit": job.cache_hit,
+            "cache_key": job.cache_key,
+            "result_url": f"/jobs/{job.id}/result",
         }
+        if run_results_input:
+            with open(job.options["run_summary"], encoding="utf-8") as f:
+                response["run_summary"] = json.load(f)
+        return response
 
+    except HTTPException:
+        raise
     except Exception as e:
         tb = traceback.format_exc()
         logging.error(f"[{request_id}] Exception: {str(e)}\n{tb}")
@@ -104,6 +417,281 @@ async def process_manifest(
         )
 
 
+@app.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_job(
+        request: Request,
+        manifest: UploadFile = File(...),
+        out_name: str = Form("raw_graph.xml"),
+        layout: str = Form("dot"),
+        compact: bool = Form(False),
+        select: str = Form(None),
+        exclude: str = Form(None),
+        pages: str = Form(None),
+        compress: bool = Form(False),
+):
+    verify_token(request)
+    options = generation_options(layout, compact, select, exclude, pages, compress)
+    job_id = uuid.uuid4().hex[:12]
+    input_path, output_path = request_paths(job_id, manifest.filename, out_name)
+    manifest_hash = await run_in_threadpool(save_upload, manifest, input_path)
+    logging.info(f"[{job_id}] Получен файл: {input_path}")
+    job = await run_in_threadpool(prepare_job, job_id, input_path, output_path, manifest_hash, options)
+    enqueue(job)
+    return {
+        **job.to_dict(),
+        "status_url": f"/jobs/{job.id}",
+        "result_url": f"/jobs/{job.id}/result",
+    }
+
+
+@app.post("/render")
+async def render_manifest(
+        request: Request,
+        manifest: UploadFile = File(...),
+        format: str = Form("svg"),
+        layout: str = Form("dot"),
+        select: str = Form(None),
+        exclude: str = Form(None),
+):
+    # Готовая картинка вместо draw.io XML: рендер на сервере в общей очереди, без draw.io и VNC
+    verify_token(request)
+    options = generation_options(layout, False, select, exclude, None, False, render=format)
+    request_id = uuid.uuid4().hex[:12]
+    input_path, output_path = request_paths(request_id, manifest.filename, f"diagram.{format}")
+    manifest_hash = await run_in_threadpool(save_upload, manifest, input_path)
+    logging.info(f"[{request_id}] Рендер {format}: {input_path}")
+    job = await run_in_threadpool(prepare_job, request_id, input_path, output_path, manifest_hash, options)
+    enqueue(job)
+    await job.done.wait()
+    if job.status != "done":
+        logging.error(f"[{request_id}] Ошибка рендера: {job.error}")
+        raise HTTPException(status_code=500, detail={"request_id": request_id, "error": job.error,
+                                                     "stderr": job.stderr[-STDERR_TAIL:]})
+    return FileResponse(output_path, media_type=MEDIA_TYPES[format], filename=f"diagram.{format}",
+                        headers={"X-Job-Id": job.id, "X-Cache-Hit": str(job.cache_hit).lower()})
+
+
+def result_media_type(path):
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    return {**MEDIA_TYPES, "sqlite": "application/vnd.sqlite3"}.get(extension, "application/xml")
+
+
+@app.post("/tiles")
+async def create_tiles(
+        request: Request,
+        manifest: UploadFile = File(...),
+        layout: str = Form("dot"),
+        select: str = Form(None),
+        exclude: str = Form(None),
+):
+    # Раскладка сохраняется в SQLite с R*Tree; браузер потом запрашивает только видимую область (/viewer)
+    verify_token(request)
+    options = generation_options(layout, False, select, exclude, None, False, tiles=True)
+    tiles_id = uuid.uuid4().hex[:12]
+    input_path, output_path = request_paths(tiles_id, manifest.filename, TILES_NAME)
+    manifest_hash = await run_in_threadpool(save_upload, manifest, input_path)
+    logging.info(f"[{tiles_id}] Хранилище для просмотра: {input_path}")
+    job = await run_in_threadpool(prepare_job, tiles_id, input_path, output_path, manifest_hash, options)
+    enqueue(job)
+    await job.done.wait()
+    if job.status != "done":
+        logging.error(f"[{tiles_id}] Ошибка построения хранилища: {job.error}")
+        raise HTTPException(status_code=500, detail={"tiles_id": tiles_id, "error": job.error,
+                                                     "stderr": job.stderr[-STDERR_TAIL:]})
+    return {
+        "tiles_id": tiles_id,
+        "cache_hit": job.cache_hit,
+        "meta": await run_in_threadpool(store_meta, output_path),
+        "cells_url": f"/tiles/{tiles_id}/cells",
+        "viewer_url": f"/viewer#id={tiles_id}",
+    }
+
+
+def tiles_path_or_404(tiles_id):
+    # По имени файла, а не по задаче в памяти: хранилище доступно до очистки /output, в том числе после рестарта
+    path = os.path.join(OUTPUT_DIR, f"{tiles_id}_{TILES_NAME}")
+    if not TILES_ID_RE.match(tiles_id) or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Tile store not found")
+    return path
+
+
+@app.get("/tiles/{tiles_id}")
+async def tiles_meta(request: Request, tiles_id: str):
+    verify_token(request)
+    return await run_in_threadpool(store_meta, tiles_path_or_404(tiles_id))
+
+
+@app.get("/tiles/{tiles_id}/cells")
+async def tiles_cells(request: Request, tiles_id: str, x0: float, y0: float, x1: float, y1: float, zoom: float = 1.0,
+                      limit: int = DEFAULT_LIMIT):
+    # Ячейки в прямоугольнике [x0, x1] x [y0, y1] с детализацией для масштаба zoom (пикселей экрана на единицу схемы)
+    verify_token(request)
+    path = tiles_path_or_404(tiles_id)
+    try:
+        result = await run_in_threadpool(query_cells, path, x0, y0, x1, y1, zoom, limit)
+    except TileStoreError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    body = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": "private, max-age=3600"}
+    encoding = negotiate(request.headers.get("Accept-Encoding"))
+    if encoding:
+        body = await run_in_threadpool(encode_bytes, body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@app.get("/viewer")
+async def viewer():
+    # Статическая страница; токен и id хранилища она берёт из #фрагмента адреса и шлёт в заголовке
+    return FileResponse(VIEWER_PATH, media_type="text/html")
+
+
+def batch_folders(filenames):
+    # Папка в архиве на каждый манифест: имя файла без расширений, повторы получают суффикс
+    folders = []
+    for filename in filenames:
+        stem = os.path.basename(filename or "").split(".")[0] or "manifest"
+        folder = stem
+        suffix = 2
+        while folder in folders:
+            folder = f"{stem}_{suffix}"
+            suffix += 1
+        folders.append(folder)
+    return folders
+
+
+def write_batch_zip(zip_path, jobs, folders, sources):
+    summary = []
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for job, folder, source in zip(jobs, folders, sources):
+            entry = {"manifest": source, "folder": folder, "status": job.status, "error": job.error, "views": []}
+            if job.status == "done":
+                for name in sorted(os.listdir(job.output_path)):
+                    arcname = f"{folder}/{name}" if len(jobs) > 1 else name
+                    archive.write(os.path.join(job.output_path, name), arcname)
+                    entry["views"].append(arcname)
+            summary.append(entry)
+        archive.writestr("batch.json", json.dumps(summary, ensure_ascii=False, indent=2))
+    return summary
+
+
+@app.post("/batch")
+async def process_batch(
+        request: Request,
+        manifests: List[UploadFile] = File(...),
+        views: str = Form(None),
+        layout: str = Form("dot"),
+        compact: bool = Form(False),
+        compress: bool = Form(False),
+):
+    # Несколько манифестов и/или несколько видов одного манифеста за один вызов; ответ — zip-архив.
+    # Каждый манифест — одна задача в очереди: разбирается один раз, раскладки его видов считаются параллельно
+    verify_token(request)
+    verify_layout(layout)
+    view_list = parse_views(views)
+    if len(manifests) > BATCH_MAX_MANIFESTS:
+        raise HTTPException(status_code=400, detail=f"at most {BATCH_MAX_MANIFESTS} manifests per batch")
+    # Быстрый отказ до сохранения файлов; окончательно места резервирует submit_all
+    if job_queue.free_slots() < len(manifests):
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, headers={"Retry-After": "30"},
+                            detail=f"queue has room for {job_queue.free_slots()} jobs, batch needs {len(manifests)}")
+    batch_id = uuid.uuid4().hex[:12]
+    jobs = []
+    workdirs = []
+    try:
+        # Сначала все файлы сохраняются и проверяются, и только потом задачи ставятся в очередь — все сразу
+        for i, upload in enumerate(manifests):
+            job_id = f"{batch_id}-{i}"
+            input_path, output_dir = request_paths(job_id, upload.filename, "views")
+            workdirs.append(os.path.dirname(input_path))
+            await run_in_threadpool(save_upload, upload, input_path)
+            views_path = os.path.join(os.path.dirname(input_path), "views.json")
+            with open(views_path, "w", encoding="utf-8") as f:
+                json.dump(view_list, f)
+            options = {"layout": layout, "compact": compact, "compress": compress, "views": views_path,
+                       "layout_workers": BATCH_LAYOUT_WORKERS}
+            jobs.append(Job(input_path, output_dir, options, job_id=job_id, batch_id=batch_id,
+                            profile_path=os.path.join(os.path.dirname(input_path), "profile.json")))
+        try:
+            job_queue.submit_all(jobs)
+        except QueueFullError as e:
+            logging.warning(f"[{batch_id}] Очередь заполнена: {e}")
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e),
+                                headers={"Retry-After": "30"})
+    except BaseException:
+        # Ни одна задача пакета не поставлена: рабочие каталоги уже сохранённых файлов не нужны
+        for workdir in workdirs:
+            shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    logging.info(f"[{batch_id}] Пакет: {len(jobs)} манифестов, {len(view_list)} видов")
+    await asyncio.gather(*(job.done.wait() for job in jobs))
+
+    zip_path = os.path.join(OUTPUT_DIR, f"{batch_id}_batch.zip")
+    summary = await run_in_threadpool(write_batch_zip, zip_path, jobs, batch_folders([m.filename for m in manifests]),
+                                      [m.filename for m in manifests])
+    if all(job.status != "done" for job in jobs):
+        os.remove(zip_path)
+        raise HTTPException(status_code=500, detail={"batch_id": batch_id, "manifests": summary})
+    return FileResponse(zip_path, media_type="application/zip", filename="batch.zip",
+                        headers={"X-Batch-Id": batch_id})
+
+
+def get_job_or_404(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(request: Request, job_id: str):
+    verify_token(request)
+    return get_job_or_404(job_id).to_dict()
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+@app.api_route("/jobs/{job_id}/result", methods=["GET", "HEAD"])
+async def job_result(request: Request, job_id: str):
+    verify_token(request)
+    job = get_job_or_404(job_id)
+    if job.batch_id:
+        # Виды пакета — каталог, а не файл; они отдаются только одним zip-архивом в ответе POST /batch
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=f"Job belongs to batch {job.batch_id}; its result is the zip returned by POST /batch")
+    if job.status == "failed":
+        return JSONResponse(status_code=500, content={**job.to_dict(), "stderr": job.stderr[-STDERR_TAIL:]})
+    if job.status != "done":
+        return JSONResponse(status_code=status.HTTP_409_CONFLICT, content=job.to_dict())
+    if not os.path.exists(job.output_path):
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Result was removed by the output cleanup")
+    if job.content_hash is None:
+        job.content_hash = await run_in_threadpool(hash_file, job.output_path)
+    encoding = negotiate(request.headers.get("Accept-Encoding"))
+    # Сжатое представление — другие байты, поэтому и ETag у него свой
+    etag = f'"{job.content_hash}-{encoding}"' if encoding else f'"{job.content_hash}"'
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    path = job.output_path
+    if encoding:
+        path = await run_in_threadpool(encoded_copy, job.output_path, encoding)
+        headers["Content-Encoding"] = encoding
+    # FileResponse отдаёт файл частями и сам обрабатывает Range / If-Range по этому ETag
+    filename = os.path.basename(job.output_path).split("_", 1)[-1]
+    return FileResponse(path, media_type=result_media_type(job.output_path), filename=filename, headers=headers)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
@@ -0,0 +1,52 @@
+"""
+Compare layout engines on random LR DAGs shaped like dbt projects (sources -> stg -> int -> marts):
+python3 benchmarks/bench_layout.py --sizes 200 1000 3000 --engines dot layered
+Crossings are counted on straight segments between node centers, for every engine alike.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from compact_graph import CompactGraph  # noqa: E402
+from generate_scheme import LAYOUT_ENGINES  # noqa: E402
+from layered_layout import count_crossings  # noqa: E402
+
+
+def random_dag(size, depth=6, max_parents=3, seed=0):
+    rng = random.Random(seed)
+    layers = [[] for _ in range(depth)]
+    graph = CompactGraph()
+    for i in range(size):
+        layer = min(depth - 1, int(rng.random() ** 1.5 * depth))
+        name = f"l{layer}_model_{i}"
+        graph.add_node(name)
+        earlier = [n for lower in layers[:layer] for n in lower[-200:]]
+        for parent in rng.sample(earlier, k=min(len(earlier), rng.randint(1, max_parents))):
+            graph.add_edge(parent, name)
+        layers[layer].append(name)
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark layout engines on synthetic DAGs.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[200, 1000, 3000])
+    parser.add_argument('--engines', nargs='+', default=sorted(LAYOUT_ENGINES), choices=sorted(LAYOUT_ENGINES))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(f"{'nodes':>7} {'edges':>7} {'engine':>8} {'seconds':>9} {'crossings':>10}")
+    for size in args.sizes:
+        graph = random_dag(size, seed=args.seed)
+        for engine in args.engines:
+            started = time.perf_counter()
+            positions, _ = LAYOUT_ENGINES[engine](graph)
+            elapsed = time.perf_counter() - started
+            crossings = count_crossings(positions, graph.edges())
+            print(f"{graph.number_of_nodes():>7} {graph.number_of_edges():>7} {engine:>8} {elapsed:>9.3f} {crossings:>10}")
+
+
+if __name__ == "__main__":
+    main()
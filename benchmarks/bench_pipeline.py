@@ -0,0 +1,126 @@
+"""
+Time every generate_scheme stage on synthetic manifests and compare with a stored baseline:
+python3 benchmarks/bench_pipeline.py --sizes 100 1000 10000 --save baseline.json
+python3 benchmarks/bench_pipeline.py --sizes 100 1000 10000 --baseline baseline.json --threshold 0.2
+Each run is a fresh generate_scheme.py --profile process, so peak RSS belongs to that run alone.
+Exits with 1 when any stage, the total or peak memory regressed beyond the threshold.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_manifest import synthetic_manifest  # noqa: E402
+
+GENERATOR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "generate_scheme.py")
+
+
+def run_once(manifest_path, workdir, layout, timeout):
+    output = os.path.join(workdir, "out.xml")
+    profile = os.path.join(workdir, "profile.json")
+    cmd = [sys.executable, GENERATOR, "--path", manifest_path, "--name", output, "--layout", layout,
+           "--seed", "0", "--profile", profile]
+    started = time.perf_counter()
+    subprocess.run(cmd, check=True, timeout=timeout, stdout=subprocess.DEVNULL)
+    total = time.perf_counter() - started
+    with open(profile, encoding="utf-8") as f:
+        report = json.load(f)
+    report["total_seconds"] = total
+    return report
+
+
+def bench_size(models, layout, repeat, timeout, workdir, seed):
+    manifest_path = os.path.join(workdir, f"manifest_{models}.json")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(synthetic_manifest(models=models, seed=seed), f)
+    runs = [run_once(manifest_path, workdir, layout, timeout) for _ in range(repeat)]
+    # Median per stage damps one-off noise; memory is the worst run
+    stages = {stage: round(statistics.median(run["stages"][stage]["wall_seconds"] for run in runs), 4)
+              for stage in runs[0]["stages"]}
+    return {
+        "stages": stages,
+        "total_seconds": round(statistics.median(run["total_seconds"] for run in runs), 4),
+        "peak_rss_bytes": max(run["peak_rss_bytes"] or 0 for run in runs),
+        "counters": runs[0]["counters"],
+        "manifest_bytes": os.path.getsize(manifest_path),
+    }
+
+
+def compare(results, baseline, threshold, min_seconds):
+    # A metric regresses when it is threshold slower/larger AND, for timings, at least min_seconds slower
+    regressions = []
+    for size, current in results.items():
+        previous = baseline.get(size)
+        if previous is None:
+            continue
+        timings = [(f"stage {stage}", seconds, previous["stages"].get(stage))
+                   for stage, seconds in current["stages"].items()]
+        timings.append(("total", current["total_seconds"], previous.get("total_seconds")))
+        for metric, value, before in timings:
+            if before is not None and value > before * (1 + threshold) and value - before >= min_seconds:
+                regressions.append(f"{size} models, {metric}: {before:.3f} s -> {value:.3f} s")
+        before = previous.get("peak_rss_bytes")
+        if before and current["peak_rss_bytes"] > before * (1 + threshold):
+            regressions.append(f"{size} models, peak RSS: {before / 1024 ** 2:.0f} MB -> "
+                               f"{current['peak_rss_bytes'] / 1024 ** 2:.0f} MB")
+    return regressions
+
+
+def print_table(results):
+    stages = list(next(iter(results.values()))["stages"])
+    print(f"{'models':>7} {'nodes':>7} {'edges':>7} " + " ".join(f"{stage[:12]:>12}" for stage in stages)
+          + f" {'total':>9} {'peak MB':>8}")
+    for size, result in results.items():
+        counters = result["counters"]
+        print(f"{size:>7} {counters.get('nodes', 0):>7} {counters.get('edges', 0):>7} "
+              + " ".join(f"{result['stages'].get(stage, 0):>12.3f}" for stage in stages)
+              + f" {result['total_seconds']:>9.3f} {result['peak_rss_bytes'] / 1024 ** 2:>8.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generate_scheme.py stages on synthetic manifests.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000], help='Model counts')
+    parser.add_argument('--layout', default='layered', choices=['dot', 'layered'],
+                        help='dot is impractical above a few thousand models')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=int, default=3600, help='Seconds per generator run')
+    parser.add_argument('--save', type=str, default=None, help='Write results as JSON (e.g. a new baseline)')
+    parser.add_argument('--baseline', type=str, default=None, help='Compare with results saved by --save')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative slowdown, 0.2 = 20%%')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='Ignore slowdowns smaller than this')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for models in args.sizes:
+            print(f"⏱️ {models} models...", file=sys.stderr)
+            results[str(models)] = bench_size(models, args.layout, args.repeat, args.timeout, workdir, args.seed)
+    print_table(results)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"layout": args.layout, "python": sys.version.split()[0], "results": results}, f, indent=2)
+        print(f"📝 Results saved to: {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("layout") != args.layout:
+            print(f"⚠️ Baseline was recorded with --layout {baseline.get('layout')}")
+        regressions = compare(results, baseline["results"], args.threshold, args.min_seconds)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            raise SystemExit(1)
+        print(f"✅ No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Synthetic dbt manifest.json for benchmarks, shaped like a real project: sources -> staging -> intermediate -> marts,
+generic tests on models and sources, descriptions of varying length and a share of models from installed packages.
+Only the fields generate_scheme reads are filled in, plus the handful dbt always writes (fqn, tags, config).
+python3 benchmarks/synthetic_manifest.py --models 10000 --out /tmp/manifest_10k.json
+"""
+
+import argparse
+import json
+import random
+
+LAYER_PREFIXES = ["stg", "int", "fct", "mart", "rpt", "exp", "agg", "dim"]
+MATERIALIZATIONS = ["view", "table", "incremental", "ephemeral"]
+WORDS = ("order customer payment revenue daily status amount event session account invoice product "
+         "region channel source grain deduplicated latest active total").split()
+
+
+def description(rng, words):
+    low, high = words
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def synthetic_manifest(models=1000, sources=None, tests_per_model=1.5, depth=5, max_parents=3, hub_share=0.02,
+                       hub_bias=0.3, description_words=(0, 40), packages=2, package_share=0.1,
+                       project_name="bench_project", seed=0):
+    # depth: model layers after sources; max_parents: fan-in per model;
+    # hub_bias: chance a parent comes from the hub_share of widely used models (controls fan-out skew)
+    rng = random.Random(seed)
+    if sources is None:
+        sources = max(1, models // 5)
+    depth = max(1, min(depth, len(LAYER_PREFIXES)))
+    package_names = [f"package_{i}" for i in range(packages)]
+    nodes = {}
+    manifest_sources = {}
+
+    source_ids = []
+    for i in range(sources):
+        schema = f"raw_{i % 10}"
+        source_id = f"source.{project_name}.{schema}.table_{i}"
+        manifest_sources[source_id] = {
+            "resource_type": "source",
+            "unique_id": source_id,
+            "name": f"table_{i}",
+            "source_name": schema,
+            "database": "warehouse",
+            "schema": schema,
+            "identifier": f"table_{i}",
+            "package_name": project_name,
+            "original_file_path": f"models/staging/{schema}/sources.yml",
+            "description": description(rng, description_words),
+            "fqn": [project_name, schema, f"table_{i}"],
+            "tags": [],
+        }
+        source_ids.append(source_id)
+
+    # Staging models are the widest layer, marts the narrowest
+    weights = [depth - layer for layer in range(depth)]
+    layers = [[] for _ in range(depth)]
+    hubs = [[] for _ in range(depth)]
+    model_ids = []
+    for i in range(models):
+        layer = rng.choices(range(depth), weights=weights)[0] if i >= depth else i
+        prefix = LAYER_PREFIXES[layer]
+        in_package = package_names and rng.random() < package_share
+        package = rng.choice(package_names) if in_package else project_name
+        name = f"{prefix}_model_{i}"
+        model_id = f"model.{package}.{name}"
+        folder = f"dbt_packages/{package}/models/{prefix}" if in_package else f"models/{prefix}"
+        if layer == 0:
+            candidates, hub_candidates = source_ids, source_ids[:max(1, int(len(source_ids) * hub_share))]
+        else:
+            lower = rng.randrange(layer)
+            candidates, hub_candidates = layers[lower][-500:], hubs[lower]
+        parents = set()
+        for _ in range(rng.randint(1, max_parents)):
+            pool = hub_candidates if hub_candidates and rng.random() < hub_bias else candidates
+            if pool:
+                parents.add(rng.choice(pool))
+        nodes[model_id] = {
+            "resource_type": "model",
+            "unique_id": model_id,
+            "name": name,
+            "package_name": package,
+            "original_file_path": f"{folder}/{name}.sql",
+            "path": f"{prefix}/{name}.sql",
+            "database": "warehouse",
+            "schema": f"analytics_{prefix}",
+            "description": description(rng, description_words),
+            "depends_on": {"nodes": sorted(parents), "macros": []},
+            "config": {"materialized": rng.choice(MATERIALIZATIONS), "tags": [prefix]},
+            "tags": [prefix],
+            "fqn": [package, prefix, name],
+        }
+        layers[layer].append(model_id)
+        if rng.random() < hub_share:
+            hubs[layer].append(model_id)
+        model_ids.append(model_id)
+
+    # Generic tests: a Poisson-ish count per model around tests_per_model, plus some on sources
+    tested = model_ids + source_ids[:len(source_ids) // 2]
+    test_total = int(len(model_ids) * tests_per_model)
+    for i in range(test_total):
+        target = rng.choice(tested)
+        kind = rng.choice(["not_null", "unique", "accepted_values", "relationships"])
+        test_id = f"test.{project_name}.{kind}_{i}"
+        nodes[test_id] = {
+            "resource_type": "test",
+            "unique_id": test_id,
+            "name": f"{kind}_{target.rsplit('.', 1)[-1]}_{i}",
+            "package_name": project_name,
+            "original_file_path": "models/schema.yml",
+            "depends_on": {"nodes": [target], "macros": [f"macro.dbt.test_{kind}"]},
+            "config": {"severity": "ERROR", "tags": []},
+            "tags": [],
+        }
+
+    return {
+        "metadata": {"dbt_schema_version": "https://schemas.getdbt.com/dbt/manifest/v12.json",
+                     "project_name": project_name},
+        "nodes": nodes,
+        "sources": manifest_sources,
+        "macros": {},
+        "exposures": {},
+        "metrics": {},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic dbt manifest.json for benchmarks.")
+    parser.add_argument('--models', type=int, default=1000)
+    parser.add_argument('--sources', type=int, default=None, help='Defaults to models / 5')
+    parser.add_argument('--tests-per-model', type=float, default=1.5)
+    parser.add_argument('--depth', type=int, default=5, help=f'Model layers, at most {len(LAYER_PREFIXES)}')
+    parser.add_argument('--max-parents', type=int, default=3, help='Fan-in: upper bound of parents per model')
+    parser.add_argument('--hub-bias', type=float, default=0.3,
+                        help='Fan-out skew: share of parent picks that go to a few widely used models')
+    parser.add_argument('--description-words', type=int, nargs=2, default=[0, 40], metavar=('MIN', 'MAX'))
+    parser.add_argument('--packages', type=int, default=2, help='Installed packages besides the project')
+    parser.add_argument('--package-share', type=float, default=0.1, help='Share of models from packages')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=str, required=True)
+    args = parser.parse_args()
+    manifest = synthetic_manifest(models=args.models, sources=args.sources, tests_per_model=args.tests_per_model,
+                                  depth=args.depth, max_parents=args.max_parents, hub_bias=args.hub_bias,
+                                  description_words=tuple(args.description_words), packages=args.packages,
+                                  package_share=args.package_share, seed=args.seed)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    print(f"📝 {len(manifest['nodes'])} nodes, {len(manifest['sources'])} sources saved to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Array-backed directed graph for the diagram pipeline. Nodes are integer ids in insertion order, keyed externally
+by dbt unique_id; attributes live in one list per column (repeated strings interned) and adjacency is CSR built
+on demand from two edge arrays. Iteration order matches networkx.DiGraph built with the same calls, so layouts
+and XML do not change. graph.nodes[key] / graph.edges[src, dst] return small read-only views with .get().
+"""
+
+import sys
+from array import array
+
+import numpy as np
+
+NODE_COLUMNS = ("name", "type", "file_path", "description", "package_name", "materialized")
+# Columns whose values repeat across many nodes
+INTERNED_COLUMNS = ("type", "package_name", "materialized", "name", "file_path")
+EDGE_TYPES = ("ref", "source", "group")
+
+
+class NodeView:
+    __slots__ = ("graph", "i")
+
+    def __init__(self, graph, i):
+        self.graph = graph
+        self.i = i
+
+    def get(self, attr, default=None):
+        value = self.graph.node_attr(self.i, attr)
+        return default if value is None else value
+
+    def __getitem__(self, attr):
+        value = self.graph.node_attr(self.i, attr)
+        if value is None:
+            raise KeyError(attr)
+        return value
+
+
+class EdgeView:
+    __slots__ = ("graph", "e")
+
+    def __init__(self, graph, e):
+        self.graph = graph
+        self.e = e
+
+    def get(self, attr, default=None):
+        if attr == "type":
+            return EDGE_TYPES[self.graph.edge_type[self.e]]
+        return self.graph.edge_extra.get(self.e, {}).get(attr, default)
+
+    def __getitem__(self, attr):
+        value = self.get(attr)
+        if value is None:
+            raise KeyError(attr)
+        return value
+
+
+class _Nodes:
+    __slots__ = ("graph",)
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __iter__(self):
+        return iter(self.graph.keys)
+
+    def __len__(self):
+        return len(self.graph.keys)
+
+    def __contains__(self, key):
+        return key in self.graph.ids
+
+    def __getitem__(self, key):
+        return NodeView(self.graph, self.graph.ids[key])
+
+    def __call__(self, data=False):
+        if not data:
+            return iter(self.graph.keys)
+        return ((key, NodeView(self.graph, i)) for i, key in enumerate(self.graph.keys))
+
+
+class _Edges:
+    __slots__ = ("graph",)
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __iter__(self):
+        keys = self.graph.keys
+        src, dst = self.graph.edge_order()
+        return ((keys[s], keys[d]) for s, d in zip(src.tolist(), dst.tolist()))
+
+    def __len__(self):
+        return len(self.graph.src)
+
+    def __call__(self, data=False):
+        if not data:
+            return iter(self)
+        keys = self.graph.keys
+        src, dst = self.graph.edge_order()
+        order = self.graph.csr["out_order"]
+        return ((keys[s], keys[d], EdgeView(self.graph, e)) for e, s, d in zip(order.tolist(), src.tolist(), dst.tolist()))
+
+    def __getitem__(self, edge):
+        return EdgeView(self.graph, self.graph.edge_position(*edge))
+
+
+class CompactGraph:
+    def __init__(self):
+        self.keys = []
+        self.ids = {}
+        self.columns = {column: [] for column in NODE_COLUMNS}
+        self.node_extra = {}  # rare attributes (group label/page) by node id
+        self.src = array("l")
+        self.dst = array("l")
+        self.edge_type = array("b")
+        self.edge_extra = {}  # edge position -> {"count": ...} for aggregated group edges
+        self._csr = None
+
+    # Building
+
+    def _node(self, key):
+        i = self.ids.get(key)
+        if i is None:
+            i = len(self.keys)
+            self.ids[key] = i
+            self.keys.append(key)
+            for values in self.columns.values():
+                values.append(None)
+            self._csr = None
+        return i
+
+    def add_node(self, key, **attrs):
+        # Like networkx: adding an existing node updates its attributes in place
+        i = self._node(key)
+        for attr, value in attrs.items():
+            if attr in self.columns:
+                if isinstance(value, str) and attr in INTERNED_COLUMNS:
+                    value = sys.intern(value)
+                self.columns[attr][i] = value
+            elif attr != "node_id":
+                self.node_extra.setdefault(i, {})[attr] = value
+        return i
+
+    def add_edge(self, src_key, dst_key, type="ref", **attrs):
+        # Missing endpoints are created, as networkx does; callers do not add the same edge twice
+        src, dst = self._node(src_key), self._node(dst_key)
+        self.src.append(src)
+        self.dst.append(dst)
+        self.edge_type.append(EDGE_TYPES.index(type))
+        if attrs:
+            self.edge_extra[len(self.src) - 1] = attrs
+        self._csr = None
+
+    # Queries
+
+    def node_attr(self, i, attr):
+        if attr in self.columns:
+            return self.columns[attr][i]
+        if attr == "node_id":
+            # dbt unique_id, only for nodes that come from the manifest
+            return self.keys[i] if self.columns["type"][i] in ("model", "source") else None
+        return self.node_extra.get(i, {}).get(attr)
+
+    def label(self, key):
+        # Text the layout engines size the node by
+        i = self.ids[key]
+        return self.node_extra.get(i, {}).get("label") or self.columns["name"][i] or key
+
+    def _build_csr(self):
+        n = len(self.keys)
+        src = np.array(self.src, dtype=np.int64)
+        dst = np.array(self.dst, dtype=np.int64)
+        # Stable sorts keep insertion order among a node's edges, like networkx adjacency dicts
+        out_order = np.argsort(src, kind="stable")
+        in_order = np.argsort(dst, kind="stable")
+        self._csr = {
+            "out_order": out_order,
+            "out_offsets": np.searchsorted(src[out_order], np.arange(n + 1)),
+            "in_order": in_order,
+            "in_offsets": np.searchsorted(dst[in_order], np.arange(n + 1)),
+            "src": src,
+            "dst": dst,
+        }
+        return self._csr
+
+    @property
+    def csr(self):
+        return self._csr or self._build_csr()
+
+    def edge_order(self):
+        # Edge endpoints as int arrays in networkx edges() order: by source node, then insertion
+        csr = self.csr
+        order = csr["out_order"]
+        return csr["src"][order], csr["dst"][order]
+
+    def edge_position(self, src_key, dst_key):
+        csr = self.csr
+        s, d = self.ids[src_key], self.ids[dst_key]
+        for e in csr["out_order"][csr["out_offsets"][s]:csr["out_offsets"][s + 1]].tolist():
+            if self.dst[e] == d:
+                return e
+        raise KeyError((src_key, dst_key))
+
+    def has_edge(self, src_key, dst_key):
+        try:
+            self.edge_position(src_key, dst_key)
+            return True
+        except KeyError:
+            return False
+
+    def successor_ids(self, i):
+        csr = self.csr
+        return csr["dst"][csr["out_order"][csr["out_offsets"][i]:csr["out_offsets"][i + 1]]]
+
+    def predecessor_ids(self, i):
+        csr = self.csr
+        return csr["src"][csr["in_order"][csr["in_offsets"][i]:csr["in_offsets"][i + 1]]]
+
+    def successors(self, key):
+        return [self.keys[j] for j in self.successor_ids(self.ids[key]).tolist()]
+
+    def predecessors(self, key):
+        return [self.keys[j] for j in self.predecessor_ids(self.ids[key]).tolist()]
+
+    def neighbors(self, key):
+        # Predecessors then successors, as (*G.pred[n], *G.succ[n]) in networkx
+        return self.predecessors(key) + self.successors(key)
+
+    @property
+    def nodes(self):
+        return _Nodes(self)
+
+    @property
+    def edges(self):
+        return _Edges(self)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.ids
+
+    def number_of_nodes(self):
+        return len(self.keys)
+
+    def number_of_edges(self):
+        return len(self.src)
+
+    def subgraph(self, keys):
+        # New independent graph with the given nodes (kept in this graph's order) and the edges between them
+        keep = np.zeros(len(self.keys), dtype=bool)
+        keep[[self.ids[key] for key in keys]] = True
+        sub = CompactGraph()
+        for i in np.flatnonzero(keep).tolist():
+            sub.add_node(self.keys[i], **{c: v[i] for c, v in self.columns.items() if v[i] is not None},
+                         **self.node_extra.get(i, {}))
+        src, dst = self.edge_order()
+        order = self.csr["out_order"]
+        for e, s, d in zip(order.tolist(), src.tolist(), dst.tolist()):
+            if keep[s] and keep[d]:
+                sub.add_edge(self.keys[s], self.keys[d], type=EDGE_TYPES[self.edge_type[e]],
+                             **self.edge_extra.get(e, {}))
+        return sub
+
+    def weakly_connected_components(self):
+        # Lists of keys, components ordered by their first node and nodes in graph order
+        n = len(self.keys)
+        component = np.full(n, -1, dtype=np.int64)
+        count = 0
+        for start in range(n):
+            if component[start] >= 0:
+                continue
+            component[start] = count
+            frontier = [start]
+            while frontier:
+                following = []
+                for i in frontier:
+                    for j in np.concatenate([self.predecessor_ids(i), self.successor_ids(i)]).tolist():
+                        if component[j] < 0:
+                            component[j] = count
+                            following.append(j)
+                frontier = following
+            count += 1
+        members = [[] for _ in range(count)]
+        for i, c in enumerate(component.tolist()):
+            members[c].append(self.keys[i])
+        return members
+
+    # Adapters for layout engines
+
+    @classmethod
+    def from_edges(cls, keys, edges, labels=None):
+        graph = cls()
+        for i, key in enumerate(keys):
+            graph.add_node(key, name=labels[i] if labels else None)
+        for src, dst in edges:
+            graph.add_edge(src, dst)
+        return graph
+
+    @classmethod
+    def from_networkx(cls, nx_graph):
+        graph = cls()
+        for key, attrs in nx_graph.nodes(data=True):
+            graph.add_node(key, **{attr: value for attr, value in attrs.items() if attr != "node_id"})
+        for src, dst, attrs in nx_graph.edges(data=True):
+            graph.add_edge(src, dst, **attrs)
+        return graph
+
+    def to_agraph(self):
+        # Only what dot needs: node names are keys, labels (which size the nodes) are model names
+        import pygraphviz
+        agraph = pygraphviz.AGraph(directed=True, strict=True)
+        for key in self.keys:
+            agraph.add_node(key, label=self.label(key))
+        agraph.add_edges_from(self.edges())
+        return agraph
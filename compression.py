@@ -0,0 +1,89 @@
+import gzip
+import os
+import shutil
+import uuid
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+class UnsupportedEncodingError(Exception):
+    pass
+
+
+def detect_encoding(fileobj):
+    # By magic bytes rather than file name or headers, which clients get wrong
+    head = fileobj.read(4)
+    fileobj.seek(0)
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def open_decompressed(fileobj):
+    # Binary stream over the upload with gzip/zstd removed on the fly; plain uploads come back as they are
+    encoding = detect_encoding(fileobj)
+    if encoding == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if encoding == "zstd":
+        if zstandard is None:
+            raise UnsupportedEncodingError("zstd uploads need the zstandard package on the server")
+        return zstandard.ZstdDecompressor().stream_reader(fileobj)
+    return fileobj
+
+
+def available_encodings():
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def negotiate(accept_encoding):
+    # Best coding from Accept-Encoding that we can produce; None means send the file as is
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def encoded_copy(path, encoding):
+    # Compressed variant kept next to the file and reused until the file is rewritten
+    target = path + SUFFIXES[encoding]
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+        return target
+    tmp_path = f"{target}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+        if encoding == "gzip":
+            with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=6, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, 1024 * 1024)
+        else:
+            zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+    os.replace(tmp_path, target)
+    return target
+
+
+def encode_bytes(data, encoding):
+    # In-memory counterpart of encoded_copy for responses built per request: faster levels, nothing is kept
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=5, mtime=0)
+    return zstandard.ZstdCompressor(level=3).compress(data)
@@ -1,13 +1,38 @@
-import xml.etree.ElementTree as ET
 import json
-import networkx as nx
-from networkx.drawing.nx_agraph import to_agraph
-import xml.dom.minidom as minidom
 import html
 import random
 import argparse
 import math
+import mmap
+import os
+import gzip
+import hashlib
+import io
+import sys
+import time
+import contextlib
 import subprocess
+import zlib
+import base64
+from urllib.parse import quote
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from layered_layout import layered_positions
+from compact_graph import CompactGraph
+from node_selection import select_nodes, SelectionError
+from svg_render import SvgWriter, RenderError, render_image, FORMATS as IMAGE_FORMATS
+from run_results import load_run_results, attach_run_results, save_summary, RunResultsError, HEAT_COLORS
+from tile_store import TileWriter
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS in the profile
+    resource = None
+
+try:
+    import ijson
+except ImportError:  # falls back to json.load + pruning
+    ijson = None
 
 """
 run from terminal:
@@ -19,364 +44,1378 @@ def main():
     parser = argparse.ArgumentParser(description="Export dbt dependency graph to draw.io format.")
     parser.add_argument('--path', type=str, required=True, help='Path to dbt manifest.json')
     parser.add_argument('--name', type=str, default='raw_graph.xml', help='Raw XML output file name')
+    parser.add_argument('--compact', action='store_true', help='Write XML without indentation')
+    parser.add_argument('--mmap', action='store_true', help='Memory-map manifest.json instead of reading it')
+    parser.add_argument('--full-manifest', action='store_true', help='Load every manifest field instead of only the used ones')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for edge attachment jitter; same input and seed give identical XML')
+    parser.add_argument('--layout', choices=sorted(LAYOUT_ENGINES), default='dot',
+                        help='Layout engine: graphviz dot or the built-in layered (Sugiyama) engine')
+    parser.add_argument('--parallel-layout', action='store_true', help='Lay out graph parts in a process pool and pack them together')
+    parser.add_argument('--layout-workers', type=int, default=None, help='Worker processes for --parallel-layout (default: all cores)')
+    parser.add_argument('--split-by', choices=['component', 'package'], default='component',
+                        help='How --parallel-layout splits the graph')
+    parser.add_argument('--component-threshold', type=int, default=50,
+                        help='Parts smaller than this are bundled into one layout job')
+    parser.add_argument('--layout-cache', type=str, default=None,
+                        help='Layout sidecar file: reused for unchanged nodes if present, rewritten after layout')
+    parser.add_argument('--select', '-s', nargs='+', default=None,
+                        help='dbt-style selectors: model, +model, model+, 2+model+1, tag:, path:, package:, source:, fqn:')
+    parser.add_argument('--exclude', nargs='+', default=None, help='Selectors to remove from the selection')
+    parser.add_argument('--pages', choices=PAGE_GROUPINGS, default=None,
+                        help='Multi-page output: overview of collapsed packages/folders plus a linked page per group')
+    parser.add_argument('--compress', action='store_true',
+                        help="Store diagrams in draw.io's compressed form (deflate + base64 inside <diagram>)")
+    parser.add_argument('--views', type=str, default=None,
+                        help='JSON list of {"name", "select", "exclude", "pages"}: one diagram per view from a single '
+                             'manifest parse, written into the --name directory')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='Write per-stage wall/CPU time, peak RSS and graph counters as JSON to this path')
+    parser.add_argument('--render', choices=IMAGE_FORMATS, default=None,
+                        help='Write the diagram as an SVG/PNG image to --name instead of draw.io XML (no draw.io needed)')
+    parser.add_argument('--tiles', action='store_true',
+                        help='Write the laid-out diagram to --name as a spatially indexed SQLite store for the tiled viewer')
+    parser.add_argument('--run-results', type=str, default=None,
+                        help='dbt run_results.json: color models by execution time and draw the critical path in bold')
+    parser.add_argument('--run-summary', type=str, default=None,
+                        help='Write critical path, slack and top bottleneck models as JSON to this path (needs --run-results)')
     args = parser.parse_args()
-    manifest = load_manifest(args.path)
-    if manifest:
-        graph = build_graph(manifest)
-        export_to_drawio(graph, manifest, raw_graph_xml=args.name)
-        # subprocess.run(["drawio", args.name])  # for generation only - comment this row
-
-def model_has_tests(model_id, manifest):
-    test_nodes = {k: v for k, v in manifest["nodes"].items() if v["resource_type"] == "test"}
-    for test_id, test in test_nodes.items():
-        if model_id in test.get("depends_on", {}).get("nodes", []):
-            return True
-    return False
+    try:
+        generate(args.path, args.name, layout=args.layout, compact=args.compact, seed=args.seed,
+                 parallel_layout=args.parallel_layout, layout_workers=args.layout_workers, split_by=args.split_by,
+                 component_threshold=args.component_threshold, layout_cache=args.layout_cache,
+                 full_manifest=args.full_manifest, use_mmap=args.mmap, profile=args.profile,
+                 select=args.select, exclude=args.exclude, pages=args.pages,
+                 compress=args.compress, views=args.views, render=args.render, tiles=args.tiles,
+                 run_results=args.run_results, run_summary=args.run_summary)
+    except GenerationError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+    # subprocess.run(["drawio", args.name])  # for generation only - comment this row
+
+class GenerationError(Exception):
+    pass
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KiB, macOS bytes
+
+class StageProfiler:
+    # Wall/CPU time and peak RSS per pipeline stage plus graph-size counters; repeated stages accumulate
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._running = {}
+
+    def start(self, name):
+        self._running[name] = (time.perf_counter(), time.process_time())
+
+    def stop(self, name):
+        wall_started, cpu_started = self._running.pop(name)
+        stage = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "calls": 0})
+        stage["wall_seconds"] += time.perf_counter() - wall_started
+        stage["cpu_seconds"] += time.process_time() - cpu_started
+        stage["calls"] += 1
+        stage["peak_rss_bytes"] = peak_rss_bytes()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        return {"stages": self.stages, "counters": self.counters, "peak_rss_bytes": peak_rss_bytes()}
+
+def generate(manifest, output=None, layout="dot", compact=False, seed=0, parallel_layout=False, layout_workers=None,
+             split_by="component", component_threshold=50, layout_cache=None, full_manifest=False, use_mmap=False,
+             profile=None, select=None, exclude=None, pages=None, compress=False, views=None, render=None,
+             tiles=False, run_results=None, run_summary=None):
+    # Callable entry point for long-lived workers. manifest: path, raw JSON bytes or parsed dict.
+    # output: path or text file object; None returns the XML as bytes. profile: path for the JSON stage report.
+    # select/exclude: dbt-style selectors (node_selection), a string or a list of strings.
+    # pages: "package" or "folder" for an overview page plus one page per group instead of a single diagram.
+    # compress: store diagrams deflated + base64 inside <diagram>, as draw.io itself saves them.
+    # views: see generate_views; output is then a directory
+    # render: "svg" or "png" for an image of the single-page diagram; output is then a path or binary file object
+    # tiles: write a tile_store SQLite file for viewport queries; output must then be a path.
+    # run_results: dbt run_results.json (path, bytes or dict) for the runtime heatmap and critical path;
+    # run_summary: path for the JSON bottleneck summary
+    if render and (pages or compress or views):
+        raise GenerationError("render draws a single diagram; it can't be combined with pages, compress or views")
+    if tiles and (pages or compress or views or render):
+        raise GenerationError("tiles store a single diagram; it can't be combined with pages, compress, views or render")
+    if tiles and not isinstance(output, (str, os.PathLike)):
+        raise GenerationError("tiles need an output file path")
+    if run_results is not None and views:
+        raise GenerationError("run_results can't be combined with views")
+    if views:
+        return generate_views(manifest, output, views, layout=layout, compact=compact, seed=seed,
+                              layout_workers=layout_workers, full_manifest=full_manifest, use_mmap=use_mmap,
+                              profile=profile, compress=compress)
+    profiler = StageProfiler()
+    fields = None if full_manifest else MANIFEST_FIELDS
+    try:
+        with profiler.stage("load_manifest"):
+            if isinstance(manifest, (bytes, bytearray)):
+                manifest = load_manifest_bytes(manifest, fields)
+            elif isinstance(manifest, (str, os.PathLike)):
+                manifest = load_manifest(manifest, fields=fields, use_mmap=use_mmap)
+        if not manifest:
+            raise GenerationError("manifest could not be loaded")
+        with profiler.stage("build_graph"):
+            index = ManifestIndex(manifest)
+            selected = None
+            if select or exclude:
+                try:
+                    selected = select_nodes(index, select, exclude)
+                except SelectionError as e:
+                    raise GenerationError(str(e)) from e
+                if not selected:
+                    raise GenerationError("selection matched no models or sources")
+                print(f"🔍 Selected {len(selected)} of {len(index.models) + len(index.sources)} models and sources")
+            graph = build_graph(manifest, index, selected)
+        if run_results is not None:
+            with profiler.stage("run_results"):
+                try:
+                    runs, elapsed_time = load_run_results(run_results)
+                except RunResultsError as e:
+                    raise GenerationError(str(e)) from e
+                summary = attach_run_results(graph, runs, elapsed_time)
+            print_bottlenecks(summary)
+            if run_summary:
+                save_summary(run_summary, summary)
+        layout_options = dict(engine=layout, parallel=parallel_layout, workers=layout_workers,
+                              split_by=split_by, component_threshold=component_threshold)
+        if render:
+            target = io.BytesIO() if output is None else output
+        else:
+            target = io.StringIO() if output is None else output
+        if pages:
+            if layout_cache:
+                print("⚠️ --layout-cache is ignored with --pages: every page gets its own layout")
+            result = export_pages(graph, manifest, raw_graph_xml=target, index=index, group_by=pages,
+                                  pretty=not compact, layout_options=layout_options, seed=seed, profiler=profiler,
+                                  compressed=compress)
+        else:
+            positions = transform = None
+            if layout_cache:
+                with profiler.stage("layout"):
+                    positions, _, transform = cached_layout_positions(graph, layout_cache, layout_options)
+            if tiles:
+                result = export_tiles(graph, target, index=index, layout_options=layout_options, seed=seed,
+                                      positions=positions, profiler=profiler, transform=transform)
+            elif render:
+                result = export_image(graph, target, index=index, image_format=render, layout_options=layout_options,
+                                      seed=seed, positions=positions, profiler=profiler, transform=transform)
+            else:
+                result = export_to_drawio(graph, manifest, raw_graph_xml=target, index=index, pretty=not compact,
+                                          layout_options=layout_options, seed=seed, positions=positions,
+                                          profiler=profiler, compressed=compress, transform=transform)
+        if result is None:
+            raise GenerationError("diagram could not be generated")
+        if output is None:
+            return target.getvalue() if render else target.getvalue().encode("utf-8")
+        return output
+    finally:
+        if profile:
+            with open(profile, "w", encoding="utf-8") as f:
+                json.dump(profiler.report(), f, indent=2)
+
+def print_bottlenecks(summary, top=5):
+    print(f"⏱ {summary['models_timed']} models ran {summary['total_execution_time']:.1f}s in total, "
+          f"critical path {summary['critical_path_seconds']:.1f}s ({len(summary['critical_path'])} models)")
+    for entry in summary["bottlenecks"][:top]:
+        mark = "critical path" if entry["on_critical_path"] else f"slack {entry['slack']:.1f}s"
+        print(f"   {entry['execution_time']:>8.1f}s  {entry['name']}  ({mark})")
+
+def load_views(views):
+    # views: list of {"name": output file, "select"?, "exclude"?, "pages"?} or a path to such a JSON list
+    if isinstance(views, (str, os.PathLike)):
+        with open(views, encoding="utf-8") as f:
+            views = json.load(f)
+    names = set()
+    for view in views:
+        name = os.path.basename(str(view.get("name", "")))
+        if not name or name in names:
+            raise GenerationError(f"every view needs a unique file name, got {view.get('name')!r}")
+        if view.get("pages") not in (None, *PAGE_GROUPINGS):
+            raise GenerationError(f"view {name}: pages must be one of: {', '.join(PAGE_GROUPINGS)}")
+        names.add(name)
+    return views
+
+def generate_views(manifest, output_dir, views, layout="dot", compact=False, seed=0, layout_workers=None,
+                   full_manifest=False, use_mmap=False, profile=None, compress=False):
+    # Several diagrams from one manifest: it is parsed and indexed once, the views' layouts run in a process pool.
+    # Returns {view name: output path}; views whose selection matches nothing are reported and skipped
+    profiler = StageProfiler()
+    views = load_views(views)
+    fields = None if full_manifest else MANIFEST_FIELDS
+    try:
+        with profiler.stage("load_manifest"):
+            if isinstance(manifest, (bytes, bytearray)):
+                manifest = load_manifest_bytes(manifest, fields)
+            elif isinstance(manifest, (str, os.PathLike)):
+                manifest = load_manifest(manifest, fields=fields, use_mmap=use_mmap)
+        if not manifest:
+            raise GenerationError("manifest could not be loaded")
+        os.makedirs(output_dir, exist_ok=True)
+        graphs = {}
+        with profiler.stage("build_graph"):
+            index = ManifestIndex(manifest)
+            for view in views:
+                name = os.path.basename(view["name"])
+                selected = None
+                if view.get("select") or view.get("exclude"):
+                    try:
+                        selected = select_nodes(index, view.get("select"), view.get("exclude"))
+                    except SelectionError as e:
+                        raise GenerationError(f"view {name}: {e}") from e
+                    if not selected:
+                        print(f"⚠️ View {name}: selection matched no models or sources, skipped")
+                        continue
+                graphs[name] = build_graph(manifest, index, selected)
+        layout_options = dict(engine=layout)
+        single_page = [view for view in views if os.path.basename(view["name"]) in graphs and not view.get("pages")]
+        positions = {}
+        with profiler.stage("layout"):
+            args = [layout_job_args(graphs[name], layout)
+                    for name in (os.path.basename(view["name"]) for view in single_page)]
+            if len(args) > 1 and layout_workers != 1:
+                with ProcessPoolExecutor(max_workers=layout_workers) as pool:
+                    results = list(pool.map(_layout_job, *zip(*args)))
+            else:
+                results = [_layout_job(*job) for job in args]
+            for view, (view_positions, _) in zip(single_page, results):
+                positions[os.path.basename(view["name"])] = view_positions
+        outputs = {}
+        for view in views:
+            name = os.path.basename(view["name"])
+            if name not in graphs:
+                continue
+            path = os.path.join(output_dir, name)
+            if view.get("pages"):
+                result = export_pages(graphs[name], manifest, raw_graph_xml=path, index=index, group_by=view["pages"],
+                                      pretty=not compact, layout_options=layout_options, seed=seed, profiler=profiler,
+                                      compressed=compress)
+            else:
+                result = export_to_drawio(graphs[name], manifest, raw_graph_xml=path, index=index, pretty=not compact,
+                                          layout_options=layout_options, seed=seed, positions=positions[name],
+                                          profiler=profiler, compressed=compress)
+            if result is None:
+                raise GenerationError(f"view {name}: diagram could not be generated")
+            outputs[name] = path
+        profiler.count("views", len(outputs))
+        return outputs
+    finally:
+        if profile:
+            with open(profile, "w", encoding="utf-8") as f:
+                json.dump(profiler.report(), f, indent=2)
+
+class ManifestIndex:
+    # One pass over manifest nodes/sources; everything build_graph/export_to_drawio look up repeatedly
+    def __init__(self, manifest):
+        self.project_name = manifest.get("metadata", {}).get("project_name", "")
+        self.nodes = manifest.get("nodes", {})
+        self.sources = manifest.get("sources", {})
+        self.models = {}
+        self.test_counts = {}
+        self.table_names = {}
+        self.packages = {}
+        self.children = {}
+        # Adjacency and lookups for node_selection
+        self.parents = {}
+        self.names = {}
+        self.tags = {}
+        for node_id, node in self.nodes.items():
+            resource_type = node.get("resource_type")
+            depends_on = node.get("depends_on", {}).get("nodes", [])
+            if resource_type == "test":
+                for dep in depends_on:
+                    self.test_counts[dep] = self.test_counts.get(dep, 0) + 1
+                continue
+            if resource_type != "model":
+                continue
+            self.models[node_id] = node
+            schema_name = node.get("schema", "")
+            table_alias = node.get("name", "")
+            self.table_names[node_id] = f"{schema_name}.{table_alias}" if schema_name else table_alias
+            self.packages.setdefault(node.get("package_name", ""), []).append(node_id)
+            self._add_lookups(node_id, node)
+            self.parents[node_id] = depends_on
+            for dep in depends_on:
+                self.children.setdefault(dep, []).append(node_id)
+        for source_id, source in self.sources.items():
+            database_name = source.get("database", "")
+            dataset_name = source.get("schema", "")
+            identifier = source.get("identifier", source.get("name", ""))
+            if database_name and dataset_name:
+                self.table_names[source_id] = f"{database_name}.{dataset_name}.{identifier}"
+            elif database_name:
+                self.table_names[source_id] = f"{database_name}.{identifier}"
+            else:
+                self.table_names[source_id] = identifier
+            self.packages.setdefault(source.get("package_name", ""), []).append(source_id)
+            self._add_lookups(source_id, source)
+        self.tested_models = {node_id for node_id in self.test_counts if node_id in self.models}
+
+    def _add_lookups(self, node_id, node):
+        self.names.setdefault(node.get("name", ""), []).append(node_id)
+        for tag in node.get("tags", ()):
+            self.tags.setdefault(tag, []).append(node_id)
+
+    def has_tests(self, node_id):
+        return node_id in self.tested_models
+
+    def is_package_node(self, node_id, file_path=""):
+        package_name = self.models.get(node_id, {}).get("package_name", "")
+        return "dbt_packages" in file_path or bool(package_name and package_name != self.project_name)
 
 def escape_xml(text):
     if not isinstance(text, str):
         text = str(text)
     return html.escape(text, quote=True)
 
-def load_manifest(path):
+def escape_xml_attr(value):
+    value = html.escape(str(value), quote=True).replace("&#x27;", "'")
+    return value.replace("\n", "&#10;").replace("\r", "&#13;").replace("\t", "&#9;")
+
+class DeflateBase64Writer:
+    # draw.io's compressed <diagram> body: base64(raw deflate(encodeURIComponent(xml))), produced chunk by chunk
+    def __init__(self, fh, level=9):
+        self.fh = fh
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        self.pending = b""
+
+    def _emit(self, data, final=False):
+        data = self.pending + data
+        # base64 without padding in the middle needs whole 3-byte groups
+        cut = len(data) if final else len(data) - len(data) % 3
+        self.fh.write(base64.b64encode(data[:cut]).decode("ascii"))
+        self.pending = data[cut:]
+
+    def write(self, text):
+        self._emit(self.compressor.compress(quote(text, safe="!*'()").encode("ascii")))
+
+    def close(self):
+        self._emit(self.compressor.flush(), final=True)
+
+class MxGraphWriter:
+    # Emits mxGraphModel cells straight to a file handle; nothing but the current cell is kept in memory.
+    # A single model is a bare <mxGraphModel>; multi-page output wraps each model in <mxfile><diagram>,
+    # compressed=True stores every page deflated like draw.io does
+    def __init__(self, fh, pretty=True, indent="  ", compressed=False):
+        self.fh = fh
+        self.pretty = pretty
+        self.indent = indent
+        self.compressed = compressed
+        self.cells_written = 0
+        self.base = 0
+        self.page_sink = None
+        self.declared = False  # the XML declaration opens the file, never a page inside it
+
+    def _write(self, depth, text):
+        if self.pretty:
+            self.fh.write(f"{self.indent * depth}{text}\n")
+        else:
+            self.fh.write(text)
+
+    @staticmethod
+    def _attrs(attrs):
+        return "".join(f' {key}="{escape_xml_attr(value)}"' for key, value in attrs.items())
+
+    def _declaration(self):
+        self.fh.write('<?xml version="1.0" ?>\n' if self.pretty else '<?xml version="1.0" ?>')
+        self.declared = True
+
+    def begin_file(self, **attrs):
+        self._file_pretty = self.pretty
+        self._declaration()
+        self._write(0, f"<mxfile{self._attrs(attrs)}>")
+        self.base = 2
+
+    def begin_page(self, page_id, name):
+        tag = f"<diagram{self._attrs(dict(id=page_id, name=name))}>"
+        if not self.compressed:
+            self._write(1, tag)
+            return
+        self.fh.write(f"{self.indent}{tag}" if self.pretty else tag)
+        # The model goes through the compressor unindented; the file around it keeps its formatting
+        self.page_sink = DeflateBase64Writer(self.fh)
+        self.fh, self.pretty, self.base = self.page_sink, False, 0
+
+    def end_page(self):
+        if self.page_sink is None:
+            self._write(1, "</diagram>")
+            return
+        self.page_sink.close()
+        self.fh, self.pretty, self.base = self.page_sink.fh, self._file_pretty, 2
+        self.page_sink = None
+        self.fh.write("</diagram>\n" if self.pretty else "</diagram>")
+
+    def end_file(self):
+        self._write(0, "</mxfile>")
+        self.base = 0
+
+    def begin(self, **attrs):
+        if not self.declared:
+            self._declaration()
+        self._write(self.base, f"<mxGraphModel{self._attrs(attrs)}>")
+        self._write(self.base + 1, "<root>")
+
+    def cell(self, geometry=None, **attrs):
+        self.cells_written += 1
+        depth = self.base + 2
+        if geometry is None:
+            self._write(depth, f"<mxCell{self._attrs(attrs)}/>")
+            return
+        self._write(depth, f"<mxCell{self._attrs(attrs)}>")
+        self._write(depth + 1, f'<mxGeometry{self._attrs(geometry)} as="geometry"/>')
+        self._write(depth, "</mxCell>")
+
+    def end(self):
+        self._write(self.base + 1, "</root>")
+        self._write(self.base, "</mxGraphModel>")
+
+# Node/source fields read by build_graph and export_to_drawio; load_manifest drops everything else
+MANIFEST_FIELDS = (
+    "resource_type", "name", "depends_on.nodes", "config.materialized", "schema", "database",
+    "identifier", "description", "package_name", "original_file_path", "tags", "fqn", "source_name",
+)
+
+def prune_node(node, fields=MANIFEST_FIELDS):
+    pruned = {}
+    for field in fields:
+        *parents, leaf = field.split(".")
+        src, dst = node, pruned
+        for key in parents:
+            src = src.get(key)
+            if not isinstance(src, dict):
+                break
+            dst = dst.setdefault(key, {})
+        else:
+            if leaf in src:
+                dst[leaf] = src[leaf]
+    return pruned
+
+def _read_value(events, event, value):
+    # The rest of a list or object whose start event was just read from an ijson.parse stream
+    if event == "start_array":
+        items = []
+        for _, event, value in events:
+            if event == "end_array":
+                return items
+            items.append(_read_value(events, event, value) if event in ("start_map", "start_array") else value)
+    obj = {}
+    for _, event, key in events:
+        if event == "end_map":
+            return obj
+        _, event, value = next(events)
+        obj[key] = _read_value(events, event, value) if event in ("start_map", "start_array") else value
+    return obj
+
+# Route kinds for _stream_manifest
+KEPT_FIELD, KEPT_PARENT, SECTION, PROJECT_NAME = range(4)
+
+def _field_routes(fields):
+    # Prefix suffix after "nodes.<id>" -> (kind, parent keys, key); a KEPT_PARENT object keeps only some fields
+    routes = {}
+    for *parents, field in (field.split(".") for field in fields):
+        for i in range(len(parents)):
+            routes.setdefault("." + ".".join(parents[:i + 1]), (KEPT_PARENT, parents[:i], parents[i]))
+        routes["." + ".".join([*parents, field])] = (KEPT_FIELD, parents, field)
+    return list(routes.items())
+
+def _stream_manifest(f, fields):
+    # A single ijson.parse pass. Events are routed by prefix: each node's kept fields go into its pruned dict,
+    # everything else (compiled SQL, columns, ...) costs one dict lookup and is never built.
+    # Same result as prune_node on json.load
+    f.seek(0)
+    field_routes = _field_routes(fields)
+    manifest = {"metadata": {"project_name": ""}, "nodes": {}, "sources": {}}
+    top_routes = {"metadata.project_name": (PROJECT_NAME, (), None), "nodes": (SECTION, (), None),
+                  "sources": (SECTION, (), None)}
+    routes = top_routes
+    events = ijson.parse(f, use_float=True)
+    for prefix, event, value in events:
+        route = routes.get(prefix)
+        if route is None:
+            continue
+        kind, parents, key = route
+        if kind == KEPT_PARENT:
+            # The object itself appears as prune_node leaves it; its other keys are skipped
+            if event == "start_map":
+                target = node
+                for parent in parents:
+                    target = target[parent]
+                target.setdefault(key, {})
+        elif kind == KEPT_FIELD:
+            if event == "map_key":
+                continue
+            target = node
+            for parent in parents:
+                target = target[parent]
+            target[key] = _read_value(events, event, value) if event in ("start_map", "start_array") else value
+        elif kind == SECTION:
+            if event == "map_key":
+                # Node ids contain dots, so each node's field prefixes are spelled out once, when it starts
+                node = manifest[prefix][value] = {}
+                base = f"{prefix}.{value}"
+                routes = {base + suffix: field_route for suffix, field_route in field_routes}
+                routes.update(top_routes)
+        elif event == "string":
+            manifest["metadata"]["project_name"] = value
+    return manifest
+
+# Smaller manifests are read with json.load: faster than streaming, and the parsed copy is still small
+STREAM_MIN_BYTES = 32 * 1024 * 1024
+
+def _read_manifest(source, fields, size=None):
+    # size: bytes to parse if known; unknown (gzip) is streamed
+    if fields is None:
+        return json.load(source)
+    if ijson is not None and (size is None or size >= STREAM_MIN_BYTES):
+        return _stream_manifest(source, fields)
+    manifest = json.load(source)
+    return {
+        "metadata": {"project_name": manifest.get("metadata", {}).get("project_name", "")},
+        "nodes": {key: prune_node(node, fields) for key, node in manifest.get("nodes", {}).items()},
+        "sources": {key: prune_node(node, fields) for key, node in manifest.get("sources", {}).items()},
+    }
+
+def load_manifest(path, fields=MANIFEST_FIELDS, use_mmap=False):
+    try:
+        with open(path, "rb") as f:
+            if f.read(2) == b"\x1f\x8b":
+                # manifest.json.gz: decompressed while parsing, never written out
+                with gzip.open(path, "rb") as gz:
+                    return _read_manifest(gz, fields)
+            f.seek(0)
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap else f
+            try:
+                return _read_manifest(source, fields, os.fstat(f.fileno()).st_size)
+            finally:
+                if use_mmap:
+                    source.close()
+    except Exception as e:
+        print(f"❌ Error loading manifest: {e}")
+        return None
+
+def load_manifest_bytes(data, fields=MANIFEST_FIELDS):
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _read_manifest(io.BytesIO(data), fields, len(data))
     except Exception as e:
         print(f"❌ Error loading manifest: {e}")
         return None
 
-def build_graph(manifest):
-    graph = nx.DiGraph()
-    nodes = manifest.get("nodes", {})
-    sources = manifest.get("sources", {})
-    for node_id, node in nodes.items():
-        if node.get("resource_type") != "model":
+def build_graph(manifest, index=None, selected=None):
+    # selected: unique ids from node_selection.select_nodes; edges leaving the selection are dropped
+    if index is None:
+        index = ManifestIndex(manifest)
+    # Keyed by unique_id, so same-named models from different packages stay apart; "name" is what gets drawn
+    graph = CompactGraph()
+    for node_id, node in index.models.items():
+        if selected is not None and node_id not in selected:
             continue
-        model_name = node["name"]
-        graph.add_node(model_name, type="model", file_path=node.get("original_file_path", ""),
-                       description=node.get("description", ""), node_id=node_id,
+        graph.add_node(node_id, name=node["name"], type="model", file_path=node.get("original_file_path", ""),
+                       description=node.get("description", ""),
                        package_name=node.get("package_name", ""),
                        materialized=node.get("config", {}).get("materialized", "unknown"))  # Исправлено
-        for dep in node.get("depends_on", {}).get("nodes", []):
-            if dep in nodes and nodes[dep]["resource_type"] == "model":
-                dep_name = nodes[dep]["name"]
-                graph.add_edge(dep_name, model_name, type="ref")
-            elif dep in sources:
-                source_name = sources[dep]["name"]
-                graph.add_node(source_name, type="source", node_id=dep)
-                graph.add_edge(source_name, model_name, type="source")
+        for dep in dict.fromkeys(node.get("depends_on", {}).get("nodes", [])):
+            if selected is not None and dep not in selected:
+                continue
+            if dep in index.models:
+                graph.add_edge(dep, node_id, type="ref")
+            elif dep in index.sources:
+                graph.add_node(dep, name=index.sources[dep]["name"], type="source")
+                graph.add_edge(dep, node_id, type="source")
+    if selected is not None:
+        # Sources selected on their own (e.g. source:raw) without a selected consumer
+        for source_id, source in index.sources.items():
+            if source_id in selected and source_id not in graph:
+                graph.add_node(source_id, name=source["name"], type="source")
     return graph
 
-def get_layout_positions(graph):
+DOT_GRAPH_ATTRS = {
+    'rankdir': 'LR',
+    'nodesep': '4.0',
+    'ranksep': '5.0',
+    'splines': 'true',
+    'overlap': 'false',
+    'pack': 'true',
+    'pad': '3.0',
+    'dpi': '300',
+    'fontsize': '11',
+    'size': '100,100',
+    'ratio': 'compress',
+}
+
+def node_size(name):
+    return max(150, min(350, len(name) * 10)), 40
+
+def dot_layout(graph):
+    A = graph.to_agraph()
+    A.graph_attr.update(DOT_GRAPH_ATTRS)
+    A.layout(prog='dot')
+    positions = {}
+    sizes = {}
+    for n in A.nodes():
+        name = n.get_name()
+        pos = n.attr.get("pos")
+        if pos:
+            x_str, y_str = pos.split(",")
+            positions[name] = (float(x_str), float(y_str))
+            sizes[name] = node_size(graph.nodes[name].get("name", name))
+    return positions, sizes
+
+def sugiyama_layout(graph, sweeps=8):
+    positions = layered_positions(graph.nodes(), None, sweeps=sweeps, arrays=graph.edge_order())
+    return positions, {node: node_size(graph.nodes[node].get("name", node)) for node in positions}
+
+LAYOUT_ENGINES = {
+    "dot": dot_layout,
+    "layered": sugiyama_layout,
+}
+
+def _layout_job(nodes, edges, engine="dot", names=None):
+    # Runs in a worker process, so it gets plain node/edge lists (plus display names for sizing) instead of the attributed graph
+    return LAYOUT_ENGINES[engine](CompactGraph.from_edges(nodes, edges, names))
+
+def layout_job_args(graph, engine="dot", nodes=None):
+    # _layout_job arguments for the whole graph or the part induced by nodes
+    sub = graph if nodes is None else graph.subgraph(nodes)
+    return list(sub), list(sub.edges()), engine, [sub.nodes[node].get("name", node) for node in sub]
+
+def split_graph(graph, split_by="component"):
+    if split_by == "package":
+        groups = {}
+        for node, attrs in graph.nodes(data=True):
+            package_name = attrs.get("package_name")
+            if package_name is None:
+                # Sources carry no package; keep them next to the first model reading from them
+                package_name = next((graph.nodes[succ].get("package_name", "") for succ in graph.successors(node)), "")
+            groups.setdefault(package_name, []).append(node)
+        return list(groups.values())
+    # Nodes keep graph order inside components so layouts do not depend on hash seeds
+    return graph.weakly_connected_components()
+
+def layout_jobs(graph, split_by="component", component_threshold=50):
+    # Large groups get a job each; small ones are bundled until a bundle reaches the threshold
+    jobs = []
+    bundle = []
+    for group in split_graph(graph, split_by):
+        if len(group) >= component_threshold:
+            jobs.append(group)
+            continue
+        bundle.extend(group)
+        if len(bundle) >= component_threshold:
+            jobs.append(bundle)
+            bundle = []
+    if bundle:
+        jobs.append(bundle)
+    return jobs
+
+def pack_layouts(layouts, gap=300):
+    # Shelf packing: tallest blocks first, shelves about as wide as a square holding all blocks
+    boxes = []
+    for positions in layouts:
+        xs = [pos[0] for pos in positions.values()]
+        ys = [pos[1] for pos in positions.values()]
+        boxes.append((min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)))
+    shelf_width = max(max(box[2] for box in boxes),
+                      math.sqrt(sum((box[2] + gap) * (box[3] + gap) for box in boxes)))
+    packed = {}
+    x = y = shelf_height = 0
+    for i in sorted(range(len(boxes)), key=lambda i: -boxes[i][3]):
+        min_x, min_y, width, height = boxes[i]
+        if x > 0 and x + width > shelf_width:
+            y += shelf_height + gap
+            x = shelf_height = 0
+        for name, (px, py) in layouts[i].items():
+            packed[name] = (px - min_x + x, py - min_y + y)
+        x += width + gap
+        shelf_height = max(shelf_height, height)
+    return packed
+
+def parallel_layout(graph, engine="dot", workers=None, split_by="component", component_threshold=50):
+    jobs = layout_jobs(graph, split_by, component_threshold)
+    args = [layout_job_args(graph, engine, job) for job in jobs]
+    if len(jobs) == 1:
+        results = [_layout_job(*args[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_layout_job, *zip(*args)))
+    sizes = {}
+    for _, job_sizes in results:
+        sizes.update(job_sizes)
+    return pack_layouts([job_positions for job_positions, _ in results if job_positions]), sizes
+
+def get_layout_positions(graph, engine="dot", parallel=False, workers=None, split_by="component", component_threshold=50):
     try:
-        A = to_agraph(graph)
-        A.graph_attr.update({
-            'rankdir': 'LR',
-            'nodesep': '4.0',
-            'ranksep': '5.0',
-            'splines': 'true',
-            'overlap': 'false',
-            'pack': 'true',
-            'pad': '3.0',
-            'dpi': '300',
-            'fontsize': '11',
-            'size': '100,100',
-            'ratio': 'compress',
-        })
-        A.layout(prog='dot')
-        positions = {}
-        sizes = {}
-        for n in A.nodes():
-            name = n.get_name()
-            pos = n.attr.get("pos")
-            if pos:
-                x_str, y_str = pos.split(",")
-                positions[name] = (float(x_str), float(y_str))
-                width = max(150, min(350, len(name) * 10))
-                height = 40
-                sizes[name] = (width, height)
-        return positions, sizes
+        if parallel and graph.number_of_nodes() > component_threshold:
+            return parallel_layout(graph, engine, workers, split_by, component_threshold)
+        return LAYOUT_ENGINES[engine](graph)
     except Exception as e:
         print(f"❌ Error in layout calculation: {e}")
         return {}, {}
 
-def get_attachment_sides_with_variation(src_pos, dst_pos):
-    dx = dst_pos[0] - src_pos[0]
-    dy = dst_pos[1] - src_pos[1]
-    delta = 0.15
-    def random_offset(base):
-        return min(1.0, max(0.0, base + random.uniform(-delta, delta)))
-    if abs(dx) > abs(dy):
-        if dx > 0:
-            exit_x, exit_y = 1.0, random_offset(0.5)
-            entry_x, entry_y = 0.0, random_offset(0.5)
-        else:
-            exit_x, exit_y = 0.0, random_offset(0.5)
-            entry_x, entry_y = 1.0, random_offset(0.5)
+LAYOUT_SIDECAR_VERSION = 3  # 2: nodes keyed by unique_id, 3: canvas transform
+
+def node_signature(graph, node):
+    # Changes whenever the node gains or loses an edge
+    parts = [node, *sorted(graph.predecessors(node)), "->", *sorted(graph.successors(node))]
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+def structure_hash(signatures):
+    return hashlib.sha1("\0".join(sorted(signatures.values())).encode("utf-8")).hexdigest()
+
+def load_layout_sidecar(path):
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Layout sidecar not used ({path}): {e}")
+        return None
+    if data.get("version") != LAYOUT_SIDECAR_VERSION:
+        return None
+    return data
+
+def save_layout_sidecar(path, positions, sizes, signatures, layout_options, transform):
+    # Flat parallel arrays in gzipped JSON: small on disk and a single json.load to read back
+    names = list(positions)
+    data = {
+        "version": LAYOUT_SIDECAR_VERSION,
+        "layout_options": layout_options,
+        "structure_hash": structure_hash(signatures),
+        "nodes": names,
+        "signatures": [signatures.get(name, "") for name in names],
+        "positions": [coord for name in names for coord in positions[name]],
+        "sizes": [dim for name in names for dim in sizes.get(name, node_size(name))],
+        "transform": list(transform),
+    }
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+
+def _place_block(block, block_sizes, anchor_offset, fixed_positions, fixed_sizes, gap=300):
+    # Move the re-laid-out block next to where its anchors were; slide it along y until it hits no fixed node
+    grid = SpatialGrid(cell_size=1000)
+    for name, (x, y) in fixed_positions.items():
+        width, height = fixed_sizes.get(name, node_size(name))
+        grid.insert(name, x - width / 2, y - height / 2, width, height)
+    xs = [pos[0] for pos in block.values()]
+    ys = [pos[1] for pos in block.values()]
+    block_height = max(ys) - min(ys) + gap
+    dx, dy = anchor_offset
+    for attempt in range(50):
+        shift = dy + (attempt + 1) // 2 * block_height * (1 if attempt % 2 else -1)
+        collides = False
+        for name, (x, y) in block.items():
+            width, height = block_sizes[name]
+            left, top = x + dx - width / 2, y + shift - height / 2
+            if any(True for _ in grid.query(left - gap / 2, top - gap / 2, left + width + gap / 2, top + height + gap / 2)):
+                collides = True
+                break
+        if not collides:
+            return {name: (x + dx, y + shift) for name, (x, y) in block.items()}
+    # No free slot nearby: park the block under the whole diagram
+    all_y = [pos[1] for pos in fixed_positions.values()]
+    shift = max(all_y) + gap - min(ys)
+    return {name: (x + dx, y + shift) for name, (x, y) in block.items()}
+
+def sidecar_layout(previous):
+    names = previous["nodes"]
+    positions = {name: tuple(previous["positions"][2 * i:2 * i + 2]) for i, name in enumerate(names)}
+    sizes = {name: tuple(previous["sizes"][2 * i:2 * i + 2]) for i, name in enumerate(names)}
+    return positions, sizes
+
+def incremental_layout(graph, previous, layout_options, signatures, max_changed_ratio=0.5):
+    names = previous["nodes"]
+    old_positions, old_sizes = sidecar_layout(previous)
+    old_signatures = dict(zip(names, previous["signatures"]))
+    changed = [node for node in graph if old_signatures.get(node) != signatures[node]]
+    changed_set = set(changed)
+    kept = {node: old_positions[node] for node in graph if node not in changed_set}
+    kept_sizes = {node: old_sizes[node] for node in kept}
+    if not changed:
+        return kept, kept_sizes, 0
+    if len(changed) > max_changed_ratio * graph.number_of_nodes() or not kept:
+        positions, sizes = get_layout_positions(graph, **layout_options)
+        return positions, sizes, len(positions)
+    # Lay out the changed nodes together with their unchanged neighbours, which pin the block in place
+    anchors = {nb for node in changed for nb in graph.neighbors(node) if nb not in changed_set}
+    block, block_sizes = get_layout_positions(graph.subgraph(changed_set | anchors), **layout_options)
+    if anchors:
+        dx = sum(kept[a][0] - block[a][0] for a in anchors) / len(anchors)
+        dy = sum(kept[a][1] - block[a][1] for a in anchors) / len(anchors)
     else:
-        if dy > 0:
-            exit_x, exit_y = random_offset(0.5), 1.0
-            entry_x, entry_y = random_offset(0.5), 0.0
-        else:
-            exit_x, exit_y = random_offset(0.5), 0.0
-            entry_x, entry_y = random_offset(0.5), 1.0
-    return (exit_x, exit_y), (entry_x, entry_y)
+        dx = max(pos[0] for pos in kept.values()) + 500 - min(block[node][0] for node in changed)
+        dy = min(pos[1] for pos in kept.values()) - min(block[node][1] for node in changed)
+    placed = _place_block({node: block[node] for node in changed}, block_sizes, (dx, dy), kept, kept_sizes)
+    positions = dict(kept)
+    positions.update(placed)
+    sizes = dict(kept_sizes)
+    sizes.update({node: block_sizes[node] for node in changed})
+    return positions, sizes, len(changed)
 
-def point_to_segment_distance(px, py, x1, y1, x2, y2):
+def cached_layout_positions(graph, sidecar_path, layout_options=None):
+    layout_options = layout_options or {}
+    signatures = {node: node_signature(graph, node) for node in graph}
+    previous = load_layout_sidecar(sidecar_path) if os.path.exists(sidecar_path) else None
+    transform = None
+    if previous and previous.get("layout_options") == layout_options \
+            and previous.get("structure_hash") == structure_hash(signatures):
+        # Same nodes with the same neighbourhoods: the stored layout is reused as is, no per-node diff
+        positions, sizes = sidecar_layout(previous)
+        print(f"♻️ Layout reused from {sidecar_path}: structure unchanged, {len(positions)} kept")
+        return positions, sizes, tuple(previous["transform"])
+    if previous and previous.get("layout_options") == layout_options:
+        positions, sizes, relaid = incremental_layout(graph, previous, layout_options, signatures)
+        print(f"♻️ Layout reused from {sidecar_path}: {len(positions) - relaid} kept, {relaid} re-laid out")
+        if relaid < len(positions):
+            # Kept nodes must land on the same canvas coordinates, so the old layout -> canvas mapping stays
+            transform = tuple(previous["transform"])
+    else:
+        positions, sizes = get_layout_positions(graph, **layout_options)
+    if not positions:
+        return positions, sizes, None
+    transform = transform or canvas_transform(positions)
+    save_layout_sidecar(sidecar_path, positions, sizes, signatures, layout_options, transform)
+    return positions, sizes, transform
+
+def attachment_sides(src_pos, dst_pos, rng=random, delta=0.15):
+    # Exit/entry points for many edges at once from (n, 2) position arrays. Every edge draws two jitters from rng,
+    # exit first, in edge order, so a seeded rng gives the same diagram as drawing them edge by edge
+    dx = dst_pos[:, 0] - src_pos[:, 0]
+    dy = dst_pos[:, 1] - src_pos[:, 1]
+    jitter = np.array([rng.uniform(-delta, delta) for _ in range(2 * len(dx))], dtype=np.float64).reshape(-1, 2)
+    exit_offset = np.minimum(1.0, np.maximum(0.0, 0.5 + jitter[:, 0]))
+    entry_offset = np.minimum(1.0, np.maximum(0.0, 0.5 + jitter[:, 1]))
+    horizontal = np.abs(dx) > np.abs(dy)
+    exit_side = np.where(np.where(horizontal, dx > 0, dy > 0), 1.0, 0.0)
+    entry_side = 1.0 - exit_side
+    return (np.where(horizontal, exit_side, exit_offset), np.where(horizontal, exit_offset, exit_side),
+            np.where(horizontal, entry_side, entry_offset), np.where(horizontal, entry_offset, entry_side))
+
+def segment_distances(px, py, segments):
+    # Distances from points (px[i], py[i]) to segments (x1, y1, x2, y2): array of shape (points, segments)
+    x1, y1, x2, y2 = (segments[:, k] for k in range(4))
     dx = x2 - x1
     dy = y2 - y1
-    if dx == 0 and dy == 0:
-        return math.sqrt((px - x1) ** 2 + (py - y1) ** 2)
-    t = max(0, min(1, ((px - x1) * dx + (py - y1) * dy) / (dx * dx + dy * dy)))
+    length2 = dx * dx + dy * dy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.clip(((px[:, None] - x1) * dx + (py[:, None] - y1) * dy) / length2, 0, 1)
+    t = np.where(length2 == 0, 0.0, t)  # zero-length segment: distance to its start
     projection_x = x1 + t * dx
     projection_y = y1 + t * dy
-    return math.sqrt((px - projection_x) ** 2 + (py - projection_y) ** 2)
-
-def get_closest_edge_points(text_x, text_y, text_width, text_height, node_x, node_y, node_width, node_height):
-    text_points = [
-        (text_x + text_width / 2, text_y, 0.5, 0.0),
-        (text_x + text_width / 2, text_y + text_height, 0.5, 1.0),
-        (text_x, text_y + text_height / 2, 0.0, 0.5),
-        (text_x + text_width, text_y + text_height / 2, 1.0, 0.5)
-    ]
-    node_points = [
-        (node_x + node_width / 2, node_y, 0.5, 0.0),
-        (node_x + node_width / 2, node_y + node_height, 0.5, 1.0),
-        (node_x, node_y + node_height / 2, 0.0, 0.5),
-        (node_x + node_width, node_y + node_height / 2, 1.0, 0.5)
-    ]
-    min_distance = float('inf')
-    best_text_point = None
-    best_node_point = None
-    for tx, ty, t_exit_x, t_exit_y in text_points:
-        for nx, ny, n_entry_x, n_entry_y in node_points:
-            distance = math.sqrt((tx - nx) ** 2 + (ty - ny) ** 2)
-            if distance < min_distance:
-                min_distance = distance
-                best_text_point = (t_exit_x, t_exit_y)
-                best_node_point = (n_entry_x, n_entry_y)
-    return best_text_point, best_node_point
-
-def get_safe_description_position(node_x, node_y, node_width, node_height, positions, sizes, text_width, text_height, current_node, graph):
-    buffer = 40
-    description = escape_xml(graph.nodes[current_node].get("description", ""))
-    description_length = len(description)
-    adjusted_text_width = min(250, max(150, 150 + (description_length // 20) * 10))
-    adjusted_text_height = min(120, max(50, 50 + (description_length // 25) * 5 + description.count("\n") * 12))
-    directions = [
-        ('top', node_x, node_y - adjusted_text_height - buffer) if description_length > 50 else ('right', node_x + node_width + buffer, node_y),
-        ('bottom', node_x, node_y + node_height + buffer) if description_length > 50 else ('left', node_x - adjusted_text_width - buffer, node_y),
-        ('right', node_x + node_width + buffer, node_y),
-        ('left', node_x - adjusted_text_width - buffer, node_y),
-        ('top', node_x, node_y - adjusted_text_height - buffer),
-        ('bottom', node_x, node_y + node_height + buffer)
+    return np.sqrt((px[:, None] - projection_x) ** 2 + (py[:, None] - projection_y) ** 2)
+
+# Side midpoints as fractions of a box, in the order ties are broken: top, bottom, left, right
+SIDE_ANCHORS = np.array([(0.5, 0.0), (0.5, 1.0), (0.0, 0.5), (1.0, 0.5)])
+
+def closest_edge_points(text_boxes, node_boxes):
+    # For (n, 4) x/y/width/height arrays: the pair of side midpoints closest to each other.
+    # Returns exit_x, exit_y (on the text box) and entry_x, entry_y (on the node) as fractions
+    def midpoints(boxes):
+        return (boxes[:, None, 0] + boxes[:, None, 2] * SIDE_ANCHORS[:, 0],
+                boxes[:, None, 1] + boxes[:, None, 3] * SIDE_ANCHORS[:, 1])
+    text_x, text_y = midpoints(text_boxes)
+    node_x, node_y = midpoints(node_boxes)
+    distance = np.sqrt((text_x[:, :, None] - node_x[:, None, :]) ** 2 + (text_y[:, :, None] - node_y[:, None, :]) ** 2)
+    best = distance.reshape(len(distance), -1).argmin(axis=1)
+    text_side, node_side = SIDE_ANCHORS[best // 4], SIDE_ANCHORS[best % 4]
+    return text_side[:, 0], text_side[:, 1], node_side[:, 0], node_side[:, 1]
+
+class SpatialGrid:
+    # Uniform grid over axis-aligned rectangles, so overlap checks only touch nearby geometry.
+    # Rectangles are also kept as NumPy rows, so callers can test a whole query result at once
+    def __init__(self, cell_size=400):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.keys = []
+        self.boxes = np.zeros((64, 4))
+
+    def _span(self, x0, y0, x1, y1):
+        return (math.floor(x0 / self.cell_size), math.floor(x1 / self.cell_size),
+                math.floor(y0 / self.cell_size), math.floor(y1 / self.cell_size))
+
+    def insert(self, key, x, y, width, height):
+        i = len(self.keys)
+        if i == len(self.boxes):
+            self.boxes = np.concatenate([self.boxes, np.zeros_like(self.boxes)])
+        self.keys.append(key)
+        self.boxes[i] = (x, y, width, height)
+        first_col, last_col, first_row, last_row = self._span(x, y, x + width, y + height)
+        for col in range(first_col, last_col + 1):
+            for row in range(first_row, last_row + 1):
+                self.cells.setdefault((col, row), []).append(i)
+        return i
+
+    def candidates(self, x0, y0, x1, y1):
+        # Row ids of rectangles sharing a cell with the box; a rectangle spanning several cells repeats
+        first_col, last_col, first_row, last_row = self._span(x0, y0, x1, y1)
+        ids = []
+        for col in range(first_col, last_col + 1):
+            for row in range(first_row, last_row + 1):
+                ids.extend(self.cells.get((col, row), ()))
+        return np.array(ids, dtype=np.int64)
+
+    def query(self, x0, y0, x1, y1):
+        for i in dict.fromkeys(self.candidates(x0, y0, x1, y1).tolist()):
+            yield self.keys[i], tuple(self.boxes[i].tolist())
+
+DESCRIPTION_DIRECTIONS = ("top", "bottom", "right", "left")
+
+def description_sizes(descriptions):
+    # Escaped description texts -> lengths, box width/height and the (one line shorter) height used for placement
+    lengths = np.array([len(text) for text in descriptions], dtype=np.int64)
+    newlines = np.array([text.count("\n") for text in descriptions], dtype=np.int64)
+    widths = np.minimum(250, np.maximum(150, 150 + (lengths // 20) * 10))
+    heights = np.minimum(120, np.maximum(50, 50 + (newlines + 1) * 12 + (lengths // 25) * 5))
+    placement_heights = np.minimum(120, np.maximum(50, 50 + (lengths // 25) * 5 + newlines * 12))
+    return lengths, widths, heights, placement_heights
+
+def description_candidates(node_boxes, lengths, widths, heights, buffer=40):
+    # Six (x, y) candidates per node in order of preference: long texts try above/below first, short ones beside.
+    # Returns x and y arrays of shape (n, 6) and indices into DESCRIPTION_DIRECTIONS
+    node_x, node_y, node_width, node_height = node_boxes.T
+    top = (node_x, node_y - heights - buffer)
+    bottom = (node_x, node_y + node_height + buffer)
+    right = (node_x + node_width + buffer, node_y)
+    left = (node_x - widths - buffer, node_y)
+    long = lengths > 50
+    candidates = [
+        [np.where(long, top[k], right[k]) for k in (0, 1)],
+        [np.where(long, bottom[k], left[k]) for k in (0, 1)],
+        right, left, top, bottom,
     ]
-    best_score = -1
-    best_position = None
-    best_direction = None
-    best_arrow_params = None
-    for direction, text_x, text_y in directions:
-        node_overlap = False
-        min_node_distance = float('inf')
-        for other_node, (other_x, other_y) in positions.items():
-            if other_node == current_node:
-                continue
-            if other_node in sizes:
-                other_width, other_height = sizes[other_node]
-                if not (text_x + adjusted_text_width + buffer < other_x or
-                        text_x > other_x + other_width + buffer or
-                        text_y + adjusted_text_height + buffer < other_y or
-                        text_y > other_y + other_height + buffer):
-                    node_overlap = True
-                    break
-                node_distance = math.sqrt((text_x + adjusted_text_width / 2 - (other_x + other_width / 2)) ** 2 +
-                                          (text_y + adjusted_text_height / 2 - (other_y + other_height / 2)) ** 2)
-                min_node_distance = min(min_node_distance, node_distance)
-        if node_overlap:
-            continue
-        min_edge_distance = float('inf')
-        text_center_x = text_x + adjusted_text_width / 2
-        text_center_y = text_y + adjusted_text_height / 2
-        for src, dst in graph.edges():
-            if current_node in (src, dst) and src in positions and dst in positions:
-                src_x, src_y = positions[src]
-                dst_x, dst_y = positions[dst]
-                edge_distance = point_to_segment_distance(text_center_x, text_center_y, src_x, src_y, dst_x, dst_y)
-                min_edge_distance = min(min_edge_distance, edge_distance)
-        score = min(min_node_distance, min_edge_distance * 2 if min_edge_distance < 80 else min_edge_distance)
-        (exit_x, exit_y), (entry_x, entry_y) = get_closest_edge_points(
-            text_x, text_y, adjusted_text_width, adjusted_text_height,
-            node_x, node_y, node_width, node_height
-        )
-        if score > best_score:
-            best_score = score
-            best_position = (text_x, text_y)
-            best_direction = direction
-            best_arrow_params = (exit_x, exit_y, entry_x, entry_y)
-    if best_position is None:
-        text_x = node_x
-        text_y = node_y + node_height + buffer * 1.5
-        (exit_x, exit_y), (entry_x, entry_y) = get_closest_edge_points(
-            text_x, text_y, adjusted_text_width, adjusted_text_height,
-            node_x, node_y, node_width, node_height
-        )
-        return text_x, text_y, 'bottom', exit_x, exit_y, entry_x, entry_y
-    return *best_position, best_direction, *best_arrow_params
-
-def export_to_drawio(graph, manifest, raw_graph_xml="raw_graph.xml"):
-    positions, sizes = get_layout_positions(graph)
+    xs = np.stack([candidate[0] for candidate in candidates], axis=1)
+    ys = np.stack([candidate[1] for candidate in candidates], axis=1)
+    directions = np.stack([np.where(long, 0, 2), np.where(long, 1, 3)] + [np.full(len(long), d) for d in (2, 3, 0, 1)],
+                          axis=1)
+    return xs, ys, directions
+
+def get_safe_description_position(xs, ys, text_width, text_height, node_row, node_box, incident_edges, spatial_index,
+                                  search_radius=600, buffer=40):
+    # Scores the candidate positions (xs, ys) of one description against everything already in spatial_index
+    # (except its own node, row node_row) and the node's incident edges. Returns (x, y, candidate index or None)
+    x0, y0 = xs - search_radius, ys - search_radius
+    x1, y1 = xs + text_width + search_radius, ys + text_height + search_radius
+    ids = spatial_index.candidates(x0.min(), y0.min(), x1.max(), y1.max())
+    ids = ids[ids != node_row]
+    other_x, other_y, other_width, other_height = spatial_index.boxes[ids].T
+    # The ids cover the search boxes of all six candidates. A rectangle outside one candidate's search box is
+    # farther than search_radius from it, so it can neither overlap it nor lower its capped distance
+    text_x, text_y = xs[:, None], ys[:, None]
+    apart = ((text_x + text_width + buffer < other_x) | (text_x > other_x + other_width + buffer) |
+             (text_y + text_height + buffer < other_y) | (text_y > other_y + other_height + buffer))
+    overlaps = ~apart.all(axis=1)
+    # Anything farther than search_radius scores as search_radius away; sqrt is monotonic, so take it after min
+    distance2 = ((text_x + text_width / 2 - (other_x + other_width / 2)) ** 2 +
+                 (text_y + text_height / 2 - (other_y + other_height / 2)) ** 2)
+    node_distance = np.minimum(search_radius, np.sqrt(distance2.min(axis=1, initial=np.inf)))
+    if len(incident_edges):
+        edge_distance = segment_distances(xs + text_width / 2, ys + text_height / 2, incident_edges).min(axis=1)
+        edge_distance = np.where(edge_distance < 80, edge_distance * 2, edge_distance)
+    else:
+        edge_distance = np.full(len(xs), np.inf)
+    score = np.where(overlaps, -np.inf, np.minimum(node_distance, edge_distance))
+    best = int(score.argmax())
+    if overlaps[best]:
+        node_x, node_y, _, node_height = node_box
+        return node_x, node_y + node_height + buffer * 1.5, None
+    return float(xs[best]), float(ys[best]), best
+
+def export_to_drawio(graph, manifest, raw_graph_xml="raw_graph.xml", index=None, pretty=True, layout_options=None, seed=0,
+                     positions=None, profiler=None, compressed=False, transform=None):
+    profiler = profiler or StageProfiler()
+    if index is None:
+        index = ManifestIndex(manifest)
+    if positions is None:
+        with profiler.stage("layout"):
+            positions, sizes = get_layout_positions(graph, **(layout_options or {}))
     if not positions:
         print("⚠️ can't find positions for graph")
-        return
-    canvas_width = 12000
-    canvas_height = 10000
-    margin = 500
+        return None
+
+    def write_file(f):
+        writer = MxGraphWriter(f, pretty=pretty, compressed=compressed)
+        if not compressed:
+            write_drawio(writer, graph, index, positions, random.Random(seed), profiler, transform=transform)
+            return
+        # Compressed pages only exist inside the <mxfile><diagram> envelope
+        writer.begin_file(host="dbt-drawio", compressed="true")
+        writer.begin_page("page-1", "Page-1")
+        write_drawio(writer, graph, index, positions, random.Random(seed), profiler, transform=transform)
+        writer.end_page()
+        writer.end_file()
+
+    try:
+        if hasattr(raw_graph_xml, "write"):
+            write_file(raw_graph_xml)
+            return raw_graph_xml
+        with open(raw_graph_xml, "w", encoding="utf-8") as f:
+            write_file(f)
+        print(f"📝 Raw graph XML saved to: {raw_graph_xml}")
+        return raw_graph_xml
+    except Exception as e:
+        print(f"❌ Error saving raw graph XML: {e}")
+        return None
+
+def export_image(graph, output, index, image_format="svg", layout_options=None, seed=0, positions=None, profiler=None,
+                 transform=None):
+    # Same cells as export_to_drawio, drawn by SvgWriter and optionally rasterized; output: path or binary file
+    profiler = profiler or StageProfiler()
+    if positions is None:
+        with profiler.stage("layout"):
+            positions, sizes = get_layout_positions(graph, **(layout_options or {}))
+    if not positions:
+        print("⚠️ can't find positions for graph")
+        return None
+    svg = io.StringIO()
+    write_drawio(SvgWriter(svg), graph, index, positions, random.Random(seed), profiler, transform=transform)
+    try:
+        with profiler.stage("render"):
+            image = render_image(svg.getvalue(), image_format)
+    except RenderError as e:
+        raise GenerationError(str(e)) from e
+    profiler.count("image_bytes", len(image))
+    if hasattr(output, "write"):
+        output.write(image)
+        return output
+    with open(output, "wb") as f:
+        f.write(image)
+    print(f"📝 {image_format.upper()} image saved to: {output}")
+    return output
+
+def export_tiles(graph, output, index, layout_options=None, seed=0, positions=None, profiler=None, transform=None):
+    # Same cells as export_to_drawio, stored in a spatially indexed SQLite file (tile_store) at path output
+    profiler = profiler or StageProfiler()
+    if positions is None:
+        with profiler.stage("layout"):
+            positions, sizes = get_layout_positions(graph, **(layout_options or {}))
+    if not positions:
+        print("⚠️ can't find positions for graph")
+        return None
+    writer = TileWriter(output)
+    write_drawio(writer, graph, index, positions, random.Random(seed), profiler, transform=transform)
+    print(f"📝 Tile store with {writer.cells_written} cells saved to: {output}")
+    return output
+
+# Multi-page output: an overview of collapsed groups plus one detail page per group
+PAGE_GROUPINGS = ("package", "folder")
+GROUP_STYLE = "shape=folder;tabWidth=40;tabHeight=14;fillColor=#dae8fc;strokeColor=#6c8ebf;fontSize=11;whiteSpace=wrap;html=1;align=center;"
+OVERVIEW_PAGE_ID = "overview"
+
+def node_group(graph, node, index, group_by):
+    node_id = graph.nodes[node].get("node_id", "")
+    dbt_node = index.models.get(node_id) or index.sources.get(node_id, {})
+    if group_by == "package":
+        return dbt_node.get("package_name") or index.project_name
+    # Sources fall into the folder of their .yml
+    return os.path.dirname(dbt_node.get("original_file_path", "")) or "."
+
+def group_node(group):
+    # Graph key of a collapsed group; model names never contain ":"
+    return f"group:{group}"
+
+def page_graphs(graph, index, group_by):
+    # Yields (page_id, page_name, graph) for the overview and every group, groups sorted by name
+    groups = {node: node_group(graph, node, index, group_by) for node in graph.nodes}
+    members = {}
+    for node, group in groups.items():
+        members.setdefault(group, []).append(node)
+    page_ids = {group: f"page-{i}" for i, group in enumerate(sorted(members), 1)}
+    crossing = {}
+    for src, dst in graph.edges():
+        if groups[src] != groups[dst]:
+            key = (groups[src], groups[dst])
+            crossing[key] = crossing.get(key, 0) + 1
+
+    overview = CompactGraph()
+    for group in sorted(members):
+        overview.add_node(group_node(group), name=group_node(group), type="group", page=page_ids[group],
+                          label=f"<b>{escape_xml(group)}</b><br>{len(members[group])} nodes")
+    for (src_group, dst_group), count in crossing.items():
+        overview.add_edge(group_node(src_group), group_node(dst_group), type="group", count=count)
+    yield OVERVIEW_PAGE_ID, f"Overview ({group_by})", overview
+
+    for group in sorted(members):
+        detail = graph.subgraph(members[group])
+        # Neighbouring groups appear as link nodes to their pages, with edges aggregated per group
+        crossing_edges = [(src, node) for node in members[group] for src in graph.predecessors(node)]
+        crossing_edges += [(node, dst) for node in members[group] for dst in graph.successors(node)]
+        stub_edges = {}
+        for src, dst in crossing_edges:
+            if groups[src] == groups[dst]:
+                continue
+            other = groups[src] if groups[dst] == group else groups[dst]
+            stub = group_node(other)
+            detail.add_node(stub, name=stub, type="group", page=page_ids[other], label=f"➜ {escape_xml(other)}")
+            edge = (stub, dst) if other == groups[src] else (src, stub)
+            stub_edges[edge] = stub_edges.get(edge, 0) + 1
+        for (src, dst), count in stub_edges.items():
+            detail.add_edge(src, dst, type="group", count=count)
+        yield page_ids[group], group, detail
+
+def export_pages(graph, manifest, raw_graph_xml="raw_graph.xml", index=None, group_by="folder", pretty=True,
+                 layout_options=None, seed=0, profiler=None, compressed=False):
+    # Every page gets its own layout, so layout and client render cost are bounded by the largest group
+    profiler = profiler or StageProfiler()
+    if index is None:
+        index = ManifestIndex(manifest)
+    rng = random.Random(seed)
+
+    def write_pages(f):
+        writer = MxGraphWriter(f, pretty=pretty, compressed=compressed)
+        writer.begin_file(host="dbt-drawio", pages=str(len(pages)), compressed=str(compressed).lower())
+        for page_id, name, page_graph in pages:
+            with profiler.stage("layout"):
+                positions, _ = get_layout_positions(page_graph, **(layout_options or {}))
+            if not positions:
+                raise GenerationError(f"can't find positions for page {name}")
+            writer.begin_page(page_id, name)
+            back_link = OVERVIEW_PAGE_ID if page_id != OVERVIEW_PAGE_ID else None
+            write_drawio(writer, page_graph, index, positions, rng, profiler, back_link=back_link)
+            writer.end_page()
+        writer.end_file()
+        profiler.count("pages", len(pages))
+
+    pages = list(page_graphs(graph, index, group_by))
+    try:
+        if hasattr(raw_graph_xml, "write"):
+            write_pages(raw_graph_xml)
+            return raw_graph_xml
+        with open(raw_graph_xml, "w", encoding="utf-8") as f:
+            write_pages(f)
+        print(f"📝 Raw graph XML with {len(pages)} pages saved to: {raw_graph_xml}")
+        return raw_graph_xml
+    except Exception as e:
+        print(f"❌ Error saving raw graph XML: {e}")
+        return None
+
+CANVAS_WIDTH = 12000
+CANVAS_HEIGHT = 10000
+CANVAS_MARGIN = 500
+
+def canvas_transform(positions):
+    # Layout coordinates -> canvas: (min_x, min_y, scale_x, scale_y) stretching the layout over the canvas
     all_x = [pos[0] for pos in positions.values()]
     all_y = [pos[1] for pos in positions.values()]
     min_x, max_x = min(all_x), max(all_x)
     min_y, max_y = min(all_y), max(all_y)
-    scale_x = (canvas_width - 2 * margin) / (max_x - min_x) if (max_x - min_x) > 0 else 1
-    scale_y = (canvas_height - 2 * margin) / (max_y - min_y) if (max_y - min_y) > 0 else 1
-    scale_x *= 1.2
-    scale_y *= 1.2
-    mxfile = ET.Element("mxfile")
-    diagram = ET.SubElement(mxfile, "diagram", id="diagram1", name="Page-1")
-    mxgraph = ET.SubElement(diagram, "mxGraphModel", dx="0", dy="0", grid="1", gridSize="10",
-                            guides="1", tooltips="1", connect="1", arrows="1", fold="1", page="1")
-    root = ET.SubElement(mxgraph, "root")
-    ET.SubElement(root, "mxCell", id="0")
-    ET.SubElement(root, "mxCell", id="1", parent="0")
+    scale_x = (CANVAS_WIDTH - 2 * CANVAS_MARGIN) / (max_x - min_x) if (max_x - min_x) > 0 else 1
+    scale_y = (CANVAS_HEIGHT - 2 * CANVAS_MARGIN) / (max_y - min_y) if (max_y - min_y) > 0 else 1
+    return min_x, min_y, scale_x * 1.2, scale_y * 1.2
+
+def write_drawio(writer, graph, index, positions, rng=None, profiler=None, back_link=None, transform=None):
+    # Edge attachment jitter comes from rng, so a fixed seed gives byte-identical output.
+    # back_link: page id for a link cell under the legend (detail pages of multi-page output).
+    # transform: canvas_transform to reuse (layout cache); by default the layout is fitted to the canvas
+    rng = rng or random.Random(0)
+    profiler = profiler or StageProfiler()
+    margin = CANVAS_MARGIN
+    min_x, min_y, scale_x, scale_y = transform or canvas_transform(positions)
+    # All geometry is computed as NumPy columns before any XML is written; the XML loop below only formats it
+    nodes = list(positions)
+    node_rows = {node: i for i, node in enumerate(nodes)}
+    spatial_index = SpatialGrid()
+    with profiler.stage("geometry"):
+        names = [graph.nodes[node].get("name", node) for node in nodes]
+        labels = [f"{escape_xml(name)}<br>{escape_xml(graph.nodes[node].get('file_path', ''))}"
+                  for node, name in zip(nodes, names)]
+        line_height = 8
+        base_height = 25
+        heights = base_height + np.array([label.count("<br>") + 1 for label in labels], dtype=np.int64) * line_height
+        widths = np.minimum(350, np.maximum(150, np.array([len(name) for name in names], dtype=np.int64) * 10))
+        pos = np.array([positions[node] for node in nodes], dtype=np.float64).reshape(-1, 2)
+        xs = margin + (pos[:, 0] - min_x) * scale_x * 0.85
+        ys = margin + (pos[:, 1] - min_y) * scale_y * 0.85
+        node_boxes = np.column_stack([xs, ys, widths, heights])
+        centers = np.column_stack([xs + widths / 2, ys + heights / 2])
+        # Python tuples keep integer widths/heights, which the XML prints as such
+        node_rects = dict(zip(nodes, zip(xs.tolist(), ys.tolist(), widths.tolist(), heights.tolist())))
+        # Node rectangles go into the spatial index up front so description boxes can avoid all of them
+        for node, (x, y, width, height) in node_rects.items():
+            spatial_index.insert(node, x, y, width, height)
+        # Edge attachment sides, in the order edges are written
+        drawn_edges = [(src, dst, edge) for src, dst, edge in graph.edges(data=True)
+                       if src in node_rows and dst in node_rows]
+        src_pos = pos[[node_rows[src] for src, _, _ in drawn_edges]].reshape(-1, 2)
+        edge_sides = np.column_stack(attachment_sides(src_pos, src_pos, rng)).tolist()
+    # Description boxes are placed before any XML is written, in the same node order as the cells below
+    description_boxes = {}
+    with profiler.stage("description_placement"):
+        descriptions = {}
+        for node in nodes:
+            description = escape_xml(graph.nodes[node].get("description", ""))
+            if description:
+                descriptions[node] = description
+        described = [node_rows[node] for node in descriptions]
+        lengths, text_widths, text_heights, placement_heights = description_sizes(list(descriptions.values()))
+        candidate_xs, candidate_ys, candidate_directions = description_candidates(
+            node_boxes[described].reshape(-1, 4), lengths, text_widths, placement_heights)
+        placed = []
+        for j, node in enumerate(descriptions):
+            row = node_rows[node]
+            neighbours = [node_rows[other] for other in graph.neighbors(node) if other in node_rows]
+            incident_edges = np.column_stack([np.repeat(centers[row:row + 1], len(neighbours), axis=0), centers[neighbours]])
+            text_width, text_height = int(text_widths[j]), int(text_heights[j])
+            text_x, text_y, best = get_safe_description_position(
+                candidate_xs[j], candidate_ys[j], text_width, int(placement_heights[j]), row, node_rects[node],
+                incident_edges, spatial_index)
+            direction = DESCRIPTION_DIRECTIONS[candidate_directions[j][best]] if best is not None else "bottom"
+            # Later descriptions must avoid this one too
+            spatial_index.insert(("description", node), text_x, text_y, text_width, text_height)
+            placed.append((text_x, text_y, text_width, int(placement_heights[j])))
+            description_boxes[node] = (text_width, text_height, text_x, text_y, direction)
+        if placed:
+            arrows = np.column_stack(closest_edge_points(np.array(placed), node_boxes[described])).tolist()
+            for node, arrow in zip(descriptions, arrows):
+                description_boxes[node] += tuple(arrow)
+    profiler.count("nodes", len(positions))
+    profiler.count("edges", graph.number_of_edges())
+    profiler.count("descriptions_placed", len(description_boxes))
+    profiler.start("xml_write")
+    writer.begin(dx="0", dy="0", grid="1", gridSize="10",
+                 guides="1", tooltips="1", connect="1", arrows="1", fold="1", page="1")
+    writer.cell(id="0")
+    writer.cell(id="1", parent="0")
     # Add legend group in the top-left corner
     legend_group_id = "legend_group"
-    legend_group = ET.SubElement(root, "mxCell", id=legend_group_id, vertex="1", parent="1")
     legend_x = 50
     legend_y = 50
     legend_width = 200
     legend_height = 360
-    ET.SubElement(legend_group, "mxGeometry", x=str(legend_x), y=str(legend_y),
-                  width=str(legend_width), height=str(legend_height), **{"as": "geometry"})
+    writer.cell(id=legend_group_id, vertex="1", parent="1",
+                geometry=dict(x=str(legend_x), y=str(legend_y), width=str(legend_width), height=str(legend_height)))
     # Legend frame
     legend_frame_style = (
         "shape=rectangle;fillColor=#f5f5f5;opacity=70;strokeColor=#000000;strokeWidth=1;"
         "fontSize=10;whiteSpace=wrap;html=1;"
     )
-    legend_frame = ET.SubElement(root, "mxCell", id="legend_frame", value="",
-                                 style=legend_frame_style, vertex="1", parent=legend_group_id)
-    ET.SubElement(legend_frame, "mxGeometry", x="0", y="0",
-                  width=str(legend_width), height=str(legend_height), **{"as": "geometry"})
+    writer.cell(id="legend_frame", value="", style=legend_frame_style, vertex="1", parent=legend_group_id,
+                geometry=dict(x="0", y="0", width=str(legend_width), height=str(legend_height)))
     # Legend title
-    legend_title = ET.SubElement(root, "mxCell", id="legend_title", value="<b>Легенда:</b>",
-                                 style="text;fontSize=12;html=1;align=left;", vertex="1", parent=legend_group_id)
-    ET.SubElement(legend_title, "mxGeometry", x="10", y="10", width="100", height="20", **{"as": "geometry"})
+    writer.cell(id="legend_title", value="<b>Легенда:</b>", style="text;fontSize=12;html=1;align=left;", vertex="1", parent=legend_group_id,
+                geometry=dict(x="10", y="10", width="100", height="20"))
     # Legend node examples
     node_width = 80
     node_height = 30
     vertical_spacing = 40
     # Source node
     source_style = "shape=step;fillColor=#ffcc00;fontSize=10;whiteSpace=wrap;html=1;align=center;"
-    source_node = ET.SubElement(root, "mxCell", id="legend_source", value="Источник",
-                                style=source_style, vertex="1", parent=legend_group_id)
-    ET.SubElement(source_node, "mxGeometry", x="10", y="40", width=str(node_width), height=str(node_height), **{"as": "geometry"})
+    writer.cell(id="legend_source", value="Источник", style=source_style, vertex="1", parent=legend_group_id,
+                geometry=dict(x="10", y="40", width=str(node_width), height=str(node_height)))
     # int_ model
     int_style = "shape=rectangle;rounded=1;fillColor=#99ccff;fontSize=10;whiteSpace=wrap;html=1;align=center;"
-    int_node = ET.SubElement(root, "mxCell", id="legend_int", value="int_ модель",
-                             style=int_style, vertex="1", parent=legend_group_id)
-    ET.SubElement(int_node, "mxGeometry", x="10", y=str(40 + vertical_spacing), width=str(node_width), height=str(node_height), **{"as": "geometry"})
+    writer.cell(id="legend_int", value="int_ модель", style=int_style, vertex="1", parent=legend_group_id,
+                geometry=dict(x="10", y=str(40 + vertical_spacing), width=str(node_width), height=str(node_height)))
     # stg_ model
     stg_style = "shape=rectangle;rounded=1;fillColor=#afbab3;fontSize=10;whiteSpace=wrap;html=1;align=center;"
-    stg_node = ET.SubElement(root, "mxCell", id="legend_stg", value="stg_ модель",
-                             style=stg_style, vertex="1", parent=legend_group_id)
-    ET.SubElement(stg_node, "mxGeometry", x="10", y=str(40 + 2 * vertical_spacing), width=str(node_width), height=str(node_height), **{"as": "geometry"})
+    writer.cell(id="legend_stg", value="stg_ модель", style=stg_style, vertex="1", parent=legend_group_id,
+                geometry=dict(x="10", y=str(40 + 2 * vertical_spacing), width=str(node_width), height=str(node_height)))
     # Regular green node
     green_style = "shape=rectangle;rounded=1;fillColor=#c2f0c2;fontSize=10;whiteSpace=wrap;html=1;align=center;"
-    green_node = ET.SubElement(root, "mxCell", id="legend_green", value="Обычная модель",
-                               style=green_style, vertex="1", parent=legend_group_id)
-    ET.SubElement(green_node, "mxGeometry", x="10", y=str(40 + 3 * vertical_spacing), width=str(node_width), height=str(node_height), **{"as": "geometry"})
+    writer.cell(id="legend_green", value="Обычная модель", style=green_style, vertex="1", parent=legend_group_id,
+                geometry=dict(x="10", y=str(40 + 3 * vertical_spacing), width=str(node_width), height=str(node_height)))
     # Node with no tests
     no_tests_style = "shape=rectangle;rounded=1;fillColor=#c2f0c2;strokeColor=#ff0000;strokeWidth=2;fontSize=10;whiteSpace=wrap;html=1;align=center;"
-    no_tests_node = ET.SubElement(root, "mxCell", id="legend_no_tests", value="Модель без тестов",
-                                  style=no_tests_style, vertex="1", parent=legend_group_id)
-    ET.SubElement(no_tests_node, "mxGeometry", x="10", y=str(40 + 4 * vertical_spacing), width=str(node_width), height=str(node_height), **{"as": "geometry"})
+    writer.cell(id="legend_no_tests", value="Модель без тестов", style=no_tests_style, vertex="1", parent=legend_group_id,
+                geometry=dict(x="10", y=str(40 + 4 * vertical_spacing), width=str(node_width), height=str(node_height)))
     # Description node
     desc_style = (
         "shape=rectangle;fillColor=#D3D3D3;opacity=50;strokeColor=#FFFF00;strokeWidth=1.5;"
         "fontSize=10;whiteSpace=wrap;html=1;align=center;"
     )
-    desc_node = ET.SubElement(root, "mxCell", id="legend_desc", value="Описание модели",
-                              style=desc_style, vertex="1", parent=legend_group_id)
-    ET.SubElement(desc_node, "mxGeometry", x="10", y=str(40 + 5 * vertical_spacing), width=str(node_width), height=str(node_height), **{"as": "geometry"})
+    writer.cell(id="legend_desc", value="Описание модели", style=desc_style, vertex="1", parent=legend_group_id,
+                geometry=dict(x="10", y=str(40 + 5 * vertical_spacing), width=str(node_width), height=str(node_height)))
     # Package model
     package_style = "shape=rectangle;fillColor=#c2f0c2;fontSize=10;whiteSpace=wrap;html=1;align=center;"
-    package_node = ET.SubElement(root, "mxCell", id="legend_package", value="Модель из dbt_packages",
-                                style=package_style, vertex="1", parent=legend_group_id)
-    ET.SubElement(package_node, "mxGeometry", x="10", y=str(40 + 6 * vertical_spacing), width=str(node_width), height=str(node_height), **{"as": "geometry"})
+    writer.cell(id="legend_package", value="Модель из dbt_packages", style=package_style, vertex="1", parent=legend_group_id,
+                geometry=dict(x="10", y=str(40 + 6 * vertical_spacing), width=str(node_width), height=str(node_height)))
     # Table name for models and sources
     table_name_style = "text;fontSize=10;html=1;align=left;verticalAlign=top;strokeColor=none;"
-    table_name_node = ET.SubElement(root, "mxCell", id="legend_table_name", value="(schema.name / db.dataset.table)",
-                                    style=table_name_style, vertex="1", parent=legend_group_id)
-    ET.SubElement(table_name_node, "mxGeometry", x="10", y=str(40 + 7 * vertical_spacing), width=str(node_width), height=str(node_height), **{"as": "geometry"})
+    writer.cell(id="legend_table_name", value="(schema.name / db.dataset.table)", style=table_name_style, vertex="1", parent=legend_group_id,
+                geometry=dict(x="10", y=str(40 + 7 * vertical_spacing), width=str(node_width), height=str(node_height)))
+    if back_link:
+        writer.cell(id="back_link", value="← Обзор", link=f"data:page/id,{back_link}",
+                    style="text;fontSize=12;html=1;align=left;fontColor=#0000EE;", vertex="1", parent="1",
+                    geometry=dict(x=str(legend_x), y=str(legend_y + legend_height + 20), width="100", height="20"))
+    # Runtime legend next to the main one, only for diagrams with run_results
+    runtimes = [graph.nodes[node].get("execution_time") for node in nodes]
+    runtimes = [runtime for runtime in runtimes if runtime is not None]
+    if runtimes:
+        critical_seconds = sum(graph.nodes[node].get("execution_time", 0) for node in nodes
+                               if graph.nodes[node].get("critical_next") is not None)
+        run_legend_id = "run_legend_group"
+        writer.cell(id=run_legend_id, vertex="1", parent="1",
+                    geometry=dict(x=str(legend_x + legend_width + 20), y=str(legend_y), width=str(legend_width), height="200"))
+        writer.cell(id="run_legend_frame", value="", style=legend_frame_style, vertex="1", parent=run_legend_id,
+                    geometry=dict(x="0", y="0", width=str(legend_width), height="200"))
+        writer.cell(id="run_legend_title", value="<b>Время выполнения:</b>", style="text;fontSize=12;html=1;align=left;",
+                    vertex="1", parent=run_legend_id, geometry=dict(x="10", y="10", width="180", height="20"))
+        heat_labels = ("быстрая модель", "средняя", f"самая долгая: {max(runtimes):.1f}s")
+        for i, (heat_color, heat_label) in enumerate(zip(HEAT_COLORS, heat_labels)):
+            writer.cell(id=f"run_legend_heat{i}", value=heat_label,
+                        style=f"shape=rectangle;rounded=1;fillColor={heat_color};fontSize=10;whiteSpace=wrap;html=1;align=center;",
+                        vertex="1", parent=run_legend_id,
+                        geometry=dict(x="10", y=str(40 + i * vertical_spacing), width="140", height=str(node_height)))
+        writer.cell(id="run_legend_critical", value=f"Критический путь: {critical_seconds:.1f}s",
+                    style="shape=rectangle;rounded=1;fillColor=#ffffff;strokeWidth=3;fontStyle=1;fontSize=10;whiteSpace=wrap;html=1;align=center;",
+                    vertex="1", parent=run_legend_id,
+                    geometry=dict(x="10", y=str(40 + 3 * vertical_spacing), width="140", height=str(node_height)))
     node_ids = {}
     label_counter = 0  # Counter for unique package label IDs
     for idx, (node, pos) in enumerate(positions.items()):
         node_id = f"id{idx}"
         node_ids[node] = node_id
         attrs = graph.nodes[node]
+        name = attrs.get("name", node)
         n_type = attrs.get("type", "model")
+        if n_type == "group":
+            x, y, width, height = node_rects[node]
+            writer.cell(id=node_id, value=attrs["label"], link=f"data:page/id,{attrs['page']}", style=GROUP_STYLE,
+                        vertex="1", parent="1",
+                        geometry=dict(x=str(x), y=str(y), width=str(width), height=str(height)))
+            continue
         description = escape_xml(attrs.get("description", ""))
         model_path = escape_xml(attrs.get("file_path", ""))
         package_name = escape_xml(attrs.get("package_name", ""))
         materialization = escape_xml(attrs.get("materialized", "unknown"))
-        project_name = manifest.get("metadata", {}).get("project_name", "")
-        is_package_model = "dbt_packages" in model_path or (package_name and package_name != project_name)
+        is_package_model = index.is_package_node(attrs.get("node_id", ""), model_path)
         if is_package_model:
             pass
             # print(f"📍 Identified package model: {node}, package: {package_name}, path: {model_path}, materialization: {materialization}")
-        label = f"{escape_xml(node)}<br>{model_path}"
-        num_lines = label.count("<br>") + 1
-        line_height = 8
-        base_height = 25
-        height = base_height + num_lines * line_height
-        width = max(150, min(350, len(node) * 10))
-        x = margin + (pos[0] - min_x) * scale_x * 0.85
-        y = margin + (pos[1] - min_y) * scale_y * 0.85
+        label = f"{escape_xml(name)}<br>{model_path}"
+        x, y, width, height = node_rects[node]
         shape = "step" if n_type == "source" else ("rectangle" if is_package_model else "rectangle;rounded=1")
         color = "#c2f0c2"
         if n_type == "source":
             color = "#ffcc00"
-        elif node.startswith("stg_") or "/stg_" in model_path:
+        elif name.startswith("stg_") or "/stg_" in model_path:
             color = "#afbab3"
-        elif node.startswith("int_") or "/int_" in model_path:
+        elif name.startswith("int_") or "/int_" in model_path:
             color = "#99ccff"
-        has_tests = model_has_tests(attrs.get("node_id", ""), manifest) if n_type != "source" else True
+        execution_time = attrs.get("execution_time")
+        if execution_time is not None:
+            color = attrs["heat_color"]
+        has_tests = index.has_tests(attrs.get("node_id", "")) if n_type != "source" else True
         border_style = "" if has_tests else "strokeColor=#ff0000;strokeWidth=2;"
+        if attrs.get("critical_next") is not None:
+            border_style += "strokeWidth=3;fontStyle=1;"
         style = f"shape={shape};fillColor={color};strokeColor=#000000;{border_style}fontSize=10;whiteSpace=wrap;html=1;align=center;verticalAlign=middle;"
-        cell = ET.SubElement(root, "mxCell", id=node_id, value=label,
-                             style=style, vertex="1", parent="1")
-        ET.SubElement(cell, "mxGeometry", x=str(x), y=str(y), width=str(width), height=str(height),
-                      **{"as": "geometry"})
+        writer.cell(id=node_id, value=label, style=style, vertex="1", parent="1",
+                    geometry=dict(x=str(x), y=str(y), width=str(width), height=str(height)))
         # Determine actual table name
-        table_name = ""
-        if n_type == "model":
-            node_id_manifest = attrs.get("node_id", "")
-            node_data = manifest["nodes"].get(node_id_manifest, {})
-            schema_name = node_data.get("schema", "")
-            table_alias = node_data.get("name", node)
-            # print(f"🔍 Model: {node}, node_id: {node_id_manifest}, schema: {schema_name}, name: {table_alias}")
-            table_name = f"{schema_name}.{table_alias}" if schema_name else table_alias
-        elif n_type == "source":
-            source_id = attrs.get("node_id", "")
-            source_data = manifest["sources"].get(source_id, {})
-            database_name = source_data.get("database", "")
-            dataset_name = source_data.get("schema", "")
-            identifier = source_data.get("identifier", node)
-            print(f"🔍 Source: {node}, source_id: {source_id}, database: {database_name}, dataset: {dataset_name}, identifier: {identifier}")
-            if database_name and dataset_name:
-                table_name = f"{database_name}.{dataset_name}.{identifier}"
-            elif database_name:
-                table_name = f"{database_name}.{identifier}"
-            else:
-                table_name = identifier
+        table_name = index.table_names.get(attrs.get("node_id", ""), "")
+        if n_type == "source":
+            print(f"🔍 Source: {name}, source_id: {attrs.get('node_id', '')}, table: {table_name}")
         table_name = escape_xml(table_name)
         # Add table name label in bottom-right corner
         if table_name:
@@ -387,10 +1426,8 @@ def export_to_drawio(graph, manifest, raw_graph_xml="raw_graph.xml"):
             table_name_label_height = 15
             table_name_label_x = x + width - table_name_label_width  # Align to right edge
             table_name_label_y = y + height  # Position below node
-            table_name_label_cell = ET.SubElement(root, "mxCell", id=table_name_label_id, value=table_name_label_value,
-                                                 style=table_name_label_style, vertex="1", parent="1")
-            ET.SubElement(table_name_label_cell, "mxGeometry", x=str(table_name_label_x), y=str(table_name_label_y),
-                          width=str(table_name_label_width), height=str(table_name_label_height), **{"as": "geometry"})
+            writer.cell(id=table_name_label_id, value=table_name_label_value, style=table_name_label_style, vertex="1", parent="1",
+                        geometry=dict(x=str(table_name_label_x), y=str(table_name_label_y), width=str(table_name_label_width), height=str(table_name_label_height)))
         # Add package name label for dbt_packages models
         if is_package_model and package_name:
             label_counter += 1
@@ -400,10 +1437,8 @@ def export_to_drawio(graph, manifest, raw_graph_xml="raw_graph.xml"):
             label_width = min(150, max(50, len(package_name) * 6))
             label_x = x
             label_y = y - 20
-            package_label_cell = ET.SubElement(root, "mxCell", id=package_label_id, value=package_label_value,
-                                               style=package_label_style, vertex="1", parent="1")
-            ET.SubElement(package_label_cell, "mxGeometry", x=str(label_x), y=str(label_y), width=str(label_width), height="15",
-                          **{"as": "geometry"})
+            writer.cell(id=package_label_id, value=package_label_value, style=package_label_style, vertex="1", parent="1",
+                        geometry=dict(x=str(label_x), y=str(label_y), width=str(label_width), height="15"))
         # Add materialization label for all models
         if materialization and n_type != "source":
             materialization_label_id = f"materialization_label{idx}"
@@ -412,60 +1447,59 @@ def export_to_drawio(graph, manifest, raw_graph_xml="raw_graph.xml"):
             materialization_label_width = min(150, max(50, len(materialization) * 6))
             materialization_label_x = x
             materialization_label_y = y + height + 5
-            materialization_label_cell = ET.SubElement(root, "mxCell", id=materialization_label_id, value=materialization_label_value,
-                                                       style=materialization_label_style, vertex="1", parent="1")
-            ET.SubElement(materialization_label_cell, "mxGeometry", x=str(materialization_label_x), y=str(materialization_label_y),
-                          width=str(materialization_label_width), height="15", **{"as": "geometry"})
-        if description:
+            writer.cell(id=materialization_label_id, value=materialization_label_value, style=materialization_label_style, vertex="1", parent="1",
+                        geometry=dict(x=str(materialization_label_x), y=str(materialization_label_y), width=str(materialization_label_width), height="15"))
+        # Execution time (and status unless success) from run_results above the right edge
+        if execution_time is not None:
+            status = attrs.get("status")
+            runtime_text = f"{execution_time:.1f}s" + (f" · {escape_xml(status)}" if status and status != "success" else "")
+            runtime_label_style = "text;fontSize=10;html=1;align=right;verticalAlign=top;strokeColor=none;fontStyle=1;"
+            runtime_label_value = f'<span style="background-color:#FFFFFF;padding:2px;">{runtime_text}</span>'
+            runtime_label_width = min(150, max(50, len(runtime_text) * 7))
+            writer.cell(id=f"runtime_label{idx}", value=runtime_label_value, style=runtime_label_style, vertex="1", parent="1",
+                        geometry=dict(x=str(x + width - runtime_label_width), y=str(y - 20), width=str(runtime_label_width), height="15"))
+        if node in description_boxes:
             text_id = f"text{idx}"
-            description_length = len(description)
-            text_lines = description.count("\n") + 1
-            text_width = min(250, max(150, 150 + (description_length // 20) * 10))
-            text_height = min(120, max(50, 50 + text_lines * 12 + (description_length // 25) * 5))
-            text_x, text_y, direction, exit_x, exit_y, entry_x, entry_y = get_safe_description_position(
-                x, y, width, height, positions, sizes, text_width, text_height, node, graph)
+            text_width, text_height, text_x, text_y, direction, exit_x, exit_y, entry_x, entry_y = description_boxes[node]
             text_style = (
                 "shape=rectangle;fillColor=#D3D3D3;opacity=50;strokeColor=#FFFF00;strokeWidth=1.5;"
                 "fontSize=10;whiteSpace=wrap;html=1;align=left;verticalAlign=top;"
             )
-            text_cell = ET.SubElement(root, "mxCell", id=text_id, value=description,
-                                      style=text_style, vertex="1", parent="1")
-            ET.SubElement(text_cell, "mxGeometry", x=str(text_x), y=str(text_y), width=str(text_width),
-                          height=str(text_height), **{"as": "geometry"})
+            writer.cell(id=text_id, value=description, style=text_style, vertex="1", parent="1",
+                        geometry=dict(x=str(text_x), y=str(text_y), width=str(text_width), height=str(text_height)))
             arrow_id = f"desc_arrow{idx}"
             arrow_style = (
                 f"edgeStyle=elbowEdgeStyle;rounded=1;html=1;strokeColor=#FFFF00;endArrow=block;"
                 f"exitX={exit_x:.2f};exitY={exit_y:.2f};entryX={entry_x:.2f};entryY={entry_y:.2f};"
                 f"jettySize=auto;orthogonal=1"
             )
-            arrow_cell = ET.SubElement(root, "mxCell", id=arrow_id, edge="1",
-                                       source=text_id, target=node_id, parent="1", style=arrow_style)
-            ET.SubElement(arrow_cell, "mxGeometry", relative="1", **{"as": "geometry"})
+            writer.cell(id=arrow_id, edge="1", source=text_id, target=node_id, parent="1", style=arrow_style,
+                        geometry=dict(relative="1"))
     edge_id = 1000
-    for src, dst in graph.edges():
+    for (src, dst, edge), (exit_x, exit_y, entry_x, entry_y) in zip(drawn_edges, edge_sides):
         if src in node_ids and dst in node_ids:
-            edge_type = graph.edges[src, dst].get("type", "ref")
+            edge_type = edge.get("type", "ref")
             stroke_color = "#0000FF" if edge_type == "source" else "#000000"
-            src_center = positions[src]
-            dst_center = positions[dst]
-            (exit_x, exit_y), (entry_x, entry_y) = get_attachment_sides_with_variation(src_center, src_center)
             arrow_style = (
                 f"edgeStyle=orthogonalEdgeStyle;curved=1;html=1;jettySize=auto;"
                 f"entryX={entry_x:.2f};entryY={entry_y:.2f};"
                 f"exitX={exit_x:.2f};exitY={exit_y:.2f};"
                 f"strokeColor={stroke_color};arrow=block;orthogonal=1;"
             )
-            edge = ET.SubElement(root, "mxCell", id=f"e{edge_id}", edge="1",
-                             source=node_ids[src], target=node_ids[dst], parent="1", style=arrow_style)
-            ET.SubElement(edge, "mxGeometry", relative="1", **{"as": "geometry"})
+            extra = {}
+            if edge_type == "group":
+                # Aggregated edge between groups: width and label show how many model edges it stands for
+                count = edge.get("count", 1)
+                arrow_style += f"strokeWidth={min(6.0, 1 + math.log2(count)):.1f};"
+                extra["value"] = str(count)
+            elif runtimes and graph.nodes[src].get("critical_next") == dst:
+                arrow_style += "strokeWidth=4;"
+            writer.cell(id=f"e{edge_id}", edge="1", source=node_ids[src], target=node_ids[dst], parent="1", style=arrow_style,
+                        geometry=dict(relative="1"), **extra)
             edge_id += 1
-    try:
-        xml_str = minidom.parseString(ET.tostring(mxgraph, encoding="unicode")).toprettyxml(indent="  ")
-        with open(raw_graph_xml, "w", encoding="utf-8") as f:
-            f.write(xml_str)
-        print(f"📝 Raw graph XML saved to: {raw_graph_xml}")
-    except Exception as e:
-        print(f"❌ Error saving raw graph XML: {e}")
+    writer.end()
+    profiler.stop("xml_write")
+    profiler.count("cells_emitted", writer.cells_written)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
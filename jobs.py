@@ -0,0 +1,229 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def generator_command(input_path, output_path, options):
+    # CLI equivalent of generate_scheme.generate(input_path, output_path, **options)
+    cmd = ["python3", "generate_scheme.py", "--path", input_path, "--name", output_path]
+    for key, value in options.items():
+        flag = "--" + key.replace("_", "-")
+        if value is True:
+            cmd.append(flag)
+        elif value not in (None, False):
+            cmd += [flag, str(value)]
+    return cmd
+
+
+class Job:
+    def __init__(self, input_path, output_path, options, on_success=None, job_id=None, profile_path=None,
+                 batch_id=None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.batch_id = batch_id  # part of a /batch call: the output is a folder that goes into its zip
+        self.input_path = input_path
+        self.output_path = output_path
+        self.options = options
+        self.on_success = on_success
+        self.profile_path = profile_path
+        self.profile = None
+        self.status = "queued"
+        self.error = None
+        self.returncode = None
+        self.stdout = ""
+        self.stderr = ""
+        self.cache_hit = False
+        self.cache_key = None
+        self.content_hash = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def generator_options(self):
+        if self.profile_path:
+            return {**self.options, "profile": self.profile_path}
+        return self.options
+
+    def load_profile(self):
+        # Stage report written by generate_scheme --profile; kept in memory, the file is removed
+        if not self.profile_path:
+            return
+        try:
+            with open(self.profile_path, encoding="utf-8") as f:
+                self.profile = json.load(f)
+            os.remove(self.profile_path)
+        except (OSError, ValueError):
+            pass
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self.done.set()
+
+    def to_dict(self):
+        started = self.started_at or self.finished_at
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "batch_id": self.batch_id,
+            "error": self.error,
+            "cache_hit": self.cache_hit,
+            "cache_key": self.cache_key,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_seconds": round((started or time.time()) - self.created_at, 3),
+            "run_seconds": round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None,
+        }
+
+
+class JobQueue:
+    # Bounded queue drained by a fixed number of workers. Jobs run in the warm pool if there is one,
+    # otherwise (or if the pool breaks) as a generator subprocess; either way with a timeout
+    def __init__(self, concurrency=2, max_depth=16, timeout=600, retention=3600, pool=None, on_finish=None):
+        self.pool = pool
+        self.on_finish = on_finish
+        self.concurrency = concurrency
+        self.max_depth = max_depth
+        self.timeout = timeout
+        self.retention = retention
+        self.jobs = {}
+        self.queue = None
+        self.workers = []
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_depth)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def _forget_old_jobs(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def add_finished(self, job):
+        # For results served without running anything (cache hits)
+        self._forget_old_jobs()
+        self.jobs[job.id] = job
+        self._finished(job)
+        return job
+
+    def _finished(self, job):
+        if self.on_finish:
+            try:
+                self.on_finish(job)
+            except Exception:
+                logging.exception(f"[{job.id}] Ошибка обработчика завершения задачи")
+
+    def submit(self, job):
+        self._forget_old_jobs()
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"queue is full ({self.max_depth} jobs waiting)")
+        self.jobs[job.id] = job
+        return job
+
+    def submit_all(self, jobs):
+        # All or nothing: the check and the puts run without an await in between, so another request
+        # cannot take the slots, and a batch never ends up half queued
+        self._forget_old_jobs()
+        if self.free_slots() < len(jobs):
+            raise QueueFullError(f"queue has room for {self.free_slots()} jobs, batch needs {len(jobs)}")
+        for job in jobs:
+            self.queue.put_nowait(job)
+            self.jobs[job.id] = job
+        return jobs
+
+    def free_slots(self):
+        return self.max_depth - self.queue.qsize()
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                logging.exception(f"[{job.id}] Ошибка выполнения задачи")
+                job.finish("failed", str(e))
+            finally:
+                job.load_profile()
+                self._finished(job)
+                self.queue.task_done()
+
+    async def _run(self, job):
+        job.status = "running"
+        job.started_at = time.time()
+        if self.pool is not None:
+            try:
+                await self._run_in_pool(job)
+                return
+            except BrokenProcessPool:
+                # The pool has already replaced the dead worker; this job is retried as a subprocess
+                logging.error(f"[{job.id}] Процесс генератора завершился аварийно, запуск через subprocess")
+        await self._run_subprocess(job)
+
+    async def _run_in_pool(self, job):
+        logging.info(f"[{job.id}] Генерация в пуле: {job.input_path} -> {job.output_path} {job.options}")
+        try:
+            job.stdout = await self.pool.run(job.input_path, job.output_path, job.generator_options(), self.timeout)
+        except asyncio.TimeoutError:
+            logging.error(f"[{job.id}] Превышено время выполнения ({self.timeout} с)")
+            job.finish("failed", f"timed out after {self.timeout} s")
+            return
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            job.stderr = f"{type(e).__name__}: {e}"
+            job.finish("failed", str(e))
+            return
+        logging.info(f"[{job.id}] stdout: {job.stdout}")
+        self._complete(job)
+
+    async def _run_subprocess(self, job):
+        cmd = generator_command(job.input_path, job.output_path, job.generator_options())
+        logging.info(f"[{job.id}] Запуск команды: {' '.join(cmd)}")
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            logging.error(f"[{job.id}] Превышено время выполнения ({self.timeout} с)")
+            job.finish("failed", f"timed out after {self.timeout} s")
+            return
+        job.returncode = proc.returncode
+        job.stdout = stdout.decode("utf-8", errors="replace")
+        job.stderr = stderr.decode("utf-8", errors="replace")
+        logging.info(f"[{job.id}] stdout: {job.stdout}")
+        logging.info(f"[{job.id}] stderr: {job.stderr}")
+        if proc.returncode != 0:
+            job.finish("failed", f"generator exited with code {proc.returncode}")
+            return
+        self._complete(job)
+
+    def _complete(self, job):
+        if not os.path.exists(job.output_path):
+            job.finish("failed", "output file was not created")
+            return
+        if job.on_success:
+            job.on_success(job)
+        job.finish("done")
@@ -0,0 +1,166 @@
+"""
+Sugiyama-style layered layout for left-to-right DAGs:
+longest-path ranking -> dummy nodes on long edges -> barycentric crossing reduction -> coordinate assignment.
+Works on integer node indices and edge arrays; generate_scheme.sugiyama_layout wraps it for CompactGraph.
+"""
+
+import numpy as np
+
+
+def edge_arrays(nodes, edges):
+    index = {name: i for i, name in enumerate(nodes)}
+    src = np.fromiter((index[s] for s, _ in edges), dtype=np.int64, count=len(edges))
+    dst = np.fromiter((index[d] for _, d in edges), dtype=np.int64, count=len(edges))
+    return src, dst
+
+
+def longest_path_ranks(n, src, dst):
+    # Relax all edges at once until nothing moves; takes (DAG depth + 1) rounds
+    rank = np.zeros(n, dtype=np.int64)
+    for _ in range(n):
+        relaxed = rank.copy()
+        np.maximum.at(relaxed, dst, rank[src] + 1)
+        if np.array_equal(relaxed, rank):
+            break
+        rank = relaxed
+    return rank
+
+
+def add_dummy_nodes(rank, src, dst):
+    # Split every edge spanning k > 1 ranks into a chain through k - 1 dummy nodes
+    span = rank[dst] - rank[src]
+    forward = span >= 1  # only a cyclic input can produce flat/backward edges; they are ignored
+    src, dst, span = src[forward], dst[forward], span[forward]
+    long = span > 1
+    short_src, short_dst = src[~long], dst[~long]
+    long_src, long_dst = src[long], dst[long]
+    counts = span[long] - 1
+    total = int(counts.sum())
+    n = len(rank)
+    dummy_ids = n + np.arange(total, dtype=np.int64)
+    edge_of = np.repeat(np.arange(len(counts)), counts)
+    offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    dummy_rank = rank[long_src][edge_of] + 1 + offset
+    previous = np.where(offset == 0, long_src[edge_of], dummy_ids - 1)
+    last = offset == counts[edge_of] - 1
+    seg_src = np.concatenate([short_src, previous, dummy_ids[last]])
+    seg_dst = np.concatenate([short_dst, dummy_ids, long_dst])
+    return np.concatenate([rank, dummy_rank]), seg_src, seg_dst
+
+
+def _layer_members(rank, order_key):
+    members = []
+    by_rank = np.lexsort((order_key, rank))
+    bounds = np.searchsorted(rank[by_rank], np.arange(rank.max() + 2))
+    for r in range(len(bounds) - 1):
+        members.append(by_rank[bounds[r]:bounds[r + 1]])
+    return members
+
+
+def _segments_by_layer(key_rank, seg_from, seg_to, layer_count):
+    # For each layer, the segments whose `seg_to` end lies in it
+    order = np.argsort(key_rank, kind="stable")
+    bounds = np.searchsorted(key_rank[order], np.arange(layer_count + 1))
+    return [(seg_from[order[bounds[r]:bounds[r + 1]]], seg_to[order[bounds[r]:bounds[r + 1]]])
+            for r in range(layer_count)]
+
+
+def reduce_crossings(rank, seg_src, seg_dst, sweeps=8):
+    n = len(rank)
+    members = _layer_members(rank, np.arange(n))
+    position = np.empty(n, dtype=np.float64)
+    for layer in members:
+        position[layer] = np.arange(len(layer))
+    layer_count = len(members)
+    incoming = _segments_by_layer(rank[seg_dst], seg_src, seg_dst, layer_count)
+    outgoing = _segments_by_layer(rank[seg_src], seg_dst, seg_src, layer_count)
+    local = np.empty(n, dtype=np.int64)
+    for layer in members:
+        local[layer] = np.arange(len(layer))
+
+    def sweep(layers, segments):
+        for r in layers:
+            layer = members[r]
+            if len(layer) < 2:
+                continue
+            neighbour, node = segments[r]
+            if len(node) == 0:
+                continue
+            # Barycenter = mean position of neighbours in the adjacent, already fixed layer
+            totals = np.bincount(local[node], weights=position[neighbour], minlength=len(layer))
+            counts = np.bincount(local[node], minlength=len(layer))
+            barycenter = np.where(counts > 0, totals / np.maximum(counts, 1), position[layer])
+            layer = layer[np.lexsort((position[layer], barycenter))]
+            members[r] = layer
+            position[layer] = np.arange(len(layer))
+            local[layer] = np.arange(len(layer))
+
+    for _ in range(sweeps):
+        sweep(range(1, layer_count), incoming)
+        sweep(range(layer_count - 2, -1, -1), outgoing)
+    return members
+
+
+def assign_coordinates(rank, members, seg_src, seg_dst, rank_sep=500.0, node_sep=120.0, passes=4):
+    n = len(rank)
+    x = rank.astype(np.float64) * rank_sep
+    y = np.empty(n, dtype=np.float64)
+    for layer in members:
+        y[layer] = (np.arange(len(layer)) - (len(layer) - 1) / 2) * node_sep
+    both_src = np.concatenate([seg_src, seg_dst])
+    both_dst = np.concatenate([seg_dst, seg_src])
+    degree = np.bincount(both_dst, minlength=n)
+    for _ in range(passes):
+        # Pull every node towards the mean height of its neighbours...
+        pull = np.bincount(both_dst, weights=y[both_src], minlength=n)
+        desired = np.where(degree > 0, pull / np.maximum(degree, 1), y)
+        # ...then push apart within each layer, keeping the order: y[i] - i * sep must be non-decreasing
+        for layer in members:
+            if len(layer) == 0:
+                continue
+            steps = np.arange(len(layer)) * node_sep
+            spread = np.maximum.accumulate(desired[layer] - steps) + steps
+            y[layer] = spread - (spread.mean() - desired[layer].mean())
+    return x, y
+
+
+def layered_positions(nodes, edges, rank_sep=500.0, node_sep=120.0, sweeps=8, arrays=None):
+    # arrays: (src, dst) node indices when the caller already has them instead of edges
+    nodes = list(nodes)
+    if not nodes:
+        return {}
+    src, dst = arrays if arrays is not None else edge_arrays(nodes, edges)
+    rank = longest_path_ranks(len(nodes), src, dst)
+    full_rank, seg_src, seg_dst = add_dummy_nodes(rank, src, dst)
+    members = reduce_crossings(full_rank, seg_src, seg_dst, sweeps=sweeps)
+    x, y = assign_coordinates(full_rank, members, seg_src, seg_dst, rank_sep=rank_sep, node_sep=node_sep)
+    return {name: (float(x[i]), float(y[i])) for i, name in enumerate(nodes)}
+
+
+def count_crossings(positions, edges, chunk=2048):
+    # Straight-segment intersections between edges that share no endpoint
+    edges = [(s, d) for s, d in edges if s in positions and d in positions]
+    if len(edges) < 2:
+        return 0
+    names = {name: i for i, name in enumerate(positions)}
+    coords = np.array(list(positions.values()), dtype=np.float64)
+    src = np.array([names[s] for s, _ in edges])
+    dst = np.array([names[d] for _, d in edges])
+    p, r = coords[src], coords[dst] - coords[src]
+    total = 0
+    for start in range(0, len(edges), chunk):
+        stop = min(start + chunk, len(edges))
+        a_p, a_r = p[start:stop, None, :], r[start:stop, None, :]
+        denom = a_r[..., 0] * r[None, :, 1] - a_r[..., 1] * r[None, :, 0]
+        qp = p[None, :, :] - a_p
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = (qp[..., 0] * r[None, :, 1] - qp[..., 1] * r[None, :, 0]) / denom
+            u = (qp[..., 0] * a_r[..., 1] - qp[..., 1] * a_r[..., 0]) / denom
+        hit = (denom != 0) & (t > 0) & (t < 1) & (u > 0) & (u < 1)
+        shared = ((src[start:stop, None] == src[None, :]) | (src[start:stop, None] == dst[None, :]) |
+                  (dst[start:stop, None] == src[None, :]) | (dst[start:stop, None] == dst[None, :]))
+        hit &= ~shared
+        # Count each unordered pair once
+        hit &= np.arange(start, stop)[:, None] < np.arange(len(edges))[None, :]
+        total += int(hit.sum())
+    return total
@@ -0,0 +1,131 @@
+"""
+dbt-style node selection over ManifestIndex adjacency:
+  orders           model by name (shell wildcards allowed) or unique_id
+  +orders          orders and all its ancestors;  2+orders  ancestors up to 2 levels
+  orders+          orders and all its descendants; orders+1 children only
+  tag:finance  path:models/marts  package:dbt_utils  source:raw.payments
+Space-separated selectors are a union, comma-separated parts of one selector an intersection.
+Graph walks only touch the selected subgraph; method lookups are dictionary hits except path and wildcards.
+"""
+
+import fnmatch
+import re
+
+SELECTOR_RE = re.compile(r"^(?:(?P<parents_depth>\d*)(?P<parents>\+))?(?P<value>[^+]+)(?:(?P<children>\+)(?P<children_depth>\d*))?$")
+METHODS = ("tag", "path", "package", "source", "fqn")
+
+
+class SelectionError(ValueError):
+    pass
+
+
+def split_selectors(selectors):
+    # "a b,c" or ["a", "b,c"] -> [["a"], ["b", "c"]]
+    if not selectors:
+        return []
+    if isinstance(selectors, str):
+        selectors = [selectors]
+    return [term.split(",") for selector in selectors for term in selector.split()]
+
+
+def parse_selector(selector):
+    match = SELECTOR_RE.match(selector)
+    if not match:
+        raise SelectionError(f"invalid selector: {selector!r}")
+    method, _, value = match.group("value").rpartition(":")
+    if method and method not in METHODS:
+        raise SelectionError(f"unknown selector method {method!r} in {selector!r}; expected one of: {', '.join(METHODS)}")
+    parents = int(match.group("parents_depth") or 0) or None if match.group("parents") else 0
+    children = int(match.group("children_depth") or 0) or None if match.group("children") else 0
+    return method or "name", value, parents, children
+
+
+def validate_selectors(selectors):
+    for term in split_selectors(selectors):
+        for selector in term:
+            parse_selector(selector)
+
+
+def _matcher(pattern):
+    if any(c in pattern for c in "*?["):
+        return re.compile(fnmatch.translate(pattern)).match
+    return pattern.__eq__
+
+
+def _base_nodes(index, method, value):
+    if method == "tag":
+        return set(index.tags.get(value, ()))
+    if method == "package":
+        return set(index.packages.get(value, ()))
+    if method == "name":
+        if value in index.models or value in index.sources:
+            return {value}
+        if not any(c in value for c in "*?["):
+            return set(index.names.get(value, ()))
+        matches = _matcher(value)
+        return {node_id for name, ids in index.names.items() if matches(name) for node_id in ids}
+    if method == "source":
+        # source:raw (whole source) or source:raw.payments
+        source_name, _, table = value.partition(".")
+        source_matches, table_matches = _matcher(source_name), _matcher(table)
+        return {source_id for source_id, source in index.sources.items()
+                if source_matches(source.get("source_name", source.get("schema", "")))
+                and (not table or table_matches(source.get("name", "")))}
+    candidates = list(index.models.items()) + list(index.sources.items())
+    if method == "path":
+        value = value.rstrip("/")
+        matches, folder = _matcher(value), value + "/"
+        return {node_id for node_id, node in candidates
+                if matches(node.get("original_file_path", "")) or node.get("original_file_path", "").startswith(folder)}
+    # fqn:marts.finance.* matches the dotted fully qualified name
+    matches = _matcher(value)
+    return {node_id for node_id, node in candidates if matches(".".join(node.get("fqn", ())))}
+
+
+def _walk(index, start, edges, depth):
+    # Breadth-first over parents or children; depth None means unlimited
+    seen = set(start)
+    frontier = list(start)
+    level = 0
+    while frontier and (depth is None or level < depth):
+        level += 1
+        following = []
+        for node_id in frontier:
+            for neighbour in edges.get(node_id, ()):
+                if neighbour not in seen and (neighbour in index.models or neighbour in index.sources):
+                    seen.add(neighbour)
+                    following.append(neighbour)
+        frontier = following
+    return seen
+
+
+def _evaluate(index, selector):
+    method, value, parents, children = parse_selector(selector)
+    base = _base_nodes(index, method, value)
+    selected = set(base)
+    if parents != 0:
+        selected |= _walk(index, base, index.parents, parents)
+    if children != 0:
+        selected |= _walk(index, base, index.children, children)
+    return selected
+
+
+def _union(index, selectors):
+    selected = set()
+    for term in split_selectors(selectors):
+        matched = _evaluate(index, term[0])
+        for selector in term[1:]:
+            matched &= _evaluate(index, selector)
+        selected |= matched
+    return selected
+
+
+def select_nodes(index, select=None, exclude=None):
+    # Unique ids of the selected models and sources; no select means everything
+    if select:
+        selected = _union(index, select)
+    else:
+        selected = set(index.models) | set(index.sources)
+    if exclude:
+        selected -= _union(index, exclude)
+    return selected
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+
+
+def _size(entry):
+    if not entry.is_dir(follow_symlinks=False):
+        return entry.stat(follow_symlinks=False).st_size
+    total = 0
+    for root, _, files in os.walk(entry.path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
+
+
+class Reaper:
+    # Periodically removes top-level files/directories older than max_age, then the oldest ones until the
+    # directory is under max_bytes. Hidden entries (e.g. the result cache, which evicts itself) are left alone
+    def __init__(self, directory, max_age, max_bytes=None, interval=300):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.task = None
+
+    def run_once(self):
+        cutoff = time.time() - self.max_age
+        entries = []
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith("."):
+                continue
+            try:
+                mtime = entry.stat(follow_symlinks=False).st_mtime
+                if mtime < cutoff:
+                    _remove(entry.path)
+                    removed += 1
+                else:
+                    entries.append((mtime, _size(entry), entry.path))
+            except FileNotFoundError:
+                pass
+        if self.max_bytes is not None:
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    _remove(path)
+                    removed += 1
+                    total -= size
+                except FileNotFoundError:
+                    pass
+        if removed:
+            logging.info(f"Очистка {self.directory}: удалено {removed}")
+        return removed
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception:
+                logging.exception(f"Ошибка очистки {self.directory}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
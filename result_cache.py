@@ -0,0 +1,68 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # Generated artifacts keyed by sha256(manifest + options); least recently used entries go first once max_bytes is exceeded.
+    # An entry is stored as <key><suffix>, the suffix being the artifact's type (.xml, .svg, .png, .sqlite, .json)
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(manifest_hash, options):
+        payload = json.dumps({"manifest": manifest_hash, "options": options}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def get(self, key, suffix):
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)  # mtime doubles as the LRU timestamp
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, source_path, suffix):
+        path = self.path(key, suffix)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                # Every entry counts, whatever its type; only copies still being written are left alone
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    logging.info(f"Кэш: удалён {path}")
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,152 @@
+"""
+dbt run_results.json overlay: each model's execution_time and status, the critical path of the drawn DAG
+(longest chain by summed execution time, i.e. the build time with unlimited threads) and per-node slack
+(how much a model could slow down before it lengthens that chain). attach_run_results stores everything as
+node attributes, so subgraphs and pages keep it, and returns the machine-readable bottleneck summary.
+"""
+
+import gzip
+import io
+import json
+import math
+import os
+
+try:
+    import ijson
+except ImportError:  # falls back to json.load
+    ijson = None
+
+TOP_BOTTLENECKS = 20
+FAILED_STATUSES = ("error", "fail", "runtime error")
+# Heatmap stops from fastest to slowest, interpolated on a log scale of execution_time / slowest
+HEAT_COLORS = ("#c2f0c2", "#ffeb84", "#f8696b")
+HEAT_FLOOR = 0.01  # models under 1% of the slowest one all get the first color
+
+
+class RunResultsError(ValueError):
+    pass
+
+
+def _timings(results):
+    return {result.get("unique_id"): (float(result.get("execution_time") or 0), result.get("status"))
+            for result in results}
+
+
+def _read(source):
+    # Results carry compiled SQL and adapter responses; with ijson only the three used fields are kept
+    if ijson is None:
+        data = json.load(source)
+        return _timings(data.get("results", [])), float(data.get("elapsed_time") or 0)
+    runs = _timings(ijson.items(source, "results.item"))
+    source.seek(0)
+    return runs, float(next(ijson.items(source, "elapsed_time"), 0) or 0)
+
+
+def load_run_results(source):
+    # source: path (plain or .gz), raw JSON bytes or parsed dict -> ({unique_id: (seconds, status)}, elapsed_time)
+    if isinstance(source, dict):
+        return _timings(source.get("results", [])), float(source.get("elapsed_time") or 0)
+    try:
+        if isinstance(source, (bytes, bytearray)):
+            return _read(io.BytesIO(source))
+        with open(source, "rb") as f:
+            if f.read(2) == b"\x1f\x8b":
+                with gzip.open(source, "rb") as gz:
+                    return _read(gz)
+            f.seek(0)
+            return _read(f)
+    except Exception as e:  # OSError, JSON errors and ijson's own parse errors
+        raise RunResultsError(f"run_results could not be loaded: {e}") from e
+
+
+def topological_order(graph):
+    # Kahn over the CSR arrays; nodes on a cycle (not possible in a dbt DAG) are left out
+    indegree = [0] * len(graph)
+    for j in graph.csr["dst"].tolist():
+        indegree[j] += 1
+    order = [i for i, degree in enumerate(indegree) if degree == 0]
+    for i in order:
+        for j in graph.successor_ids(i).tolist():
+            indegree[j] -= 1
+            if indegree[j] == 0:
+                order.append(j)
+    return order
+
+
+def critical_path(graph, seconds):
+    # seconds: per node id. Returns (node ids on the longest path in order, earliest finish, slack) per node id
+    order = topological_order(graph)
+    finish = [0.0] * len(graph)
+    previous = [-1] * len(graph)
+    for i in order:
+        start = 0.0
+        for p in graph.predecessor_ids(i).tolist():
+            if finish[p] > start:
+                start, previous[i] = finish[p], p
+        finish[i] = start + seconds[i]
+    makespan = max(finish, default=0.0)
+    latest = [makespan] * len(graph)
+    for i in reversed(order):
+        for s in graph.successor_ids(i).tolist():
+            latest[i] = min(latest[i], latest[s] - seconds[s])
+    slack = [max(0.0, latest[i] - finish[i]) for i in range(len(graph))]
+    path = []
+    i = finish.index(makespan) if finish else -1
+    while i >= 0 and makespan > 0:
+        path.append(i)
+        i = previous[i]
+    return path[::-1], finish, slack
+
+
+def heat_color(seconds, slowest):
+    if slowest <= 0:
+        return HEAT_COLORS[0]
+    # 0 at HEAT_FLOOR * slowest and below, 1 for the slowest model
+    position = 1 + math.log(min(1.0, max(seconds / slowest, HEAT_FLOOR))) / -math.log(HEAT_FLOOR)
+    position *= len(HEAT_COLORS) - 1
+    low = min(int(position), len(HEAT_COLORS) - 2)
+    fraction = position - low
+    a, b = HEAT_COLORS[low], HEAT_COLORS[low + 1]
+    channels = [round(int(a[k:k + 2], 16) * (1 - fraction) + int(b[k:k + 2], 16) * fraction) for k in (1, 3, 5)]
+    return "#" + "".join(f"{channel:02x}" for channel in channels)
+
+
+def attach_run_results(graph, runs, elapsed_time=0.0, top=TOP_BOTTLENECKS):
+    # Sets execution_time/status/slack/heat_color on nodes that ran and critical_next on critical path nodes
+    # (the next node on the path, "" for its last one). Returns the summary
+    seconds = [runs[key][0] if key in runs else 0.0 for key in graph.keys]
+    path, finish, slack = critical_path(graph, seconds)
+    timed = [i for i, key in enumerate(graph.keys) if key in runs]
+    slowest = max((seconds[i] for i in timed), default=0.0)
+    for i in timed:
+        key = graph.keys[i]
+        graph.add_node(key, execution_time=seconds[i], status=runs[key][1], slack=round(slack[i], 3),
+                       heat_color=heat_color(seconds[i], slowest))
+    for i, following in zip(path, path[1:] + [None]):
+        graph.add_node(graph.keys[i], critical_next=graph.keys[following] if following is not None else "")
+    on_path = set(path)
+
+    def entry(i):
+        return {"unique_id": graph.keys[i], "name": graph.nodes[graph.keys[i]].get("name", graph.keys[i]),
+                "execution_time": round(seconds[i], 3), "status": runs.get(graph.keys[i], (0, None))[1],
+                "slack": round(slack[i], 3), "finish": round(finish[i], 3), "on_critical_path": i in on_path}
+
+    # Critical path models first (speeding them up shortens the build), then the rest by runtime
+    ranked = sorted(timed, key=lambda i: (i not in on_path, -seconds[i]))
+    return {
+        "models_timed": len(timed),
+        "total_execution_time": round(sum(seconds[i] for i in timed), 3),
+        "elapsed_time": round(elapsed_time, 3),
+        "critical_path_seconds": round(max(finish, default=0.0), 3),
+        "critical_path": [entry(i) for i in path],
+        "bottlenecks": [entry(i) for i in ranked[:top]],
+        "failed": [entry(i) for i in timed if runs[graph.keys[i]][1] in FAILED_STATUSES],
+        "not_run": [key for key in graph.keys if key not in runs and graph.nodes[key].get("type") == "model"],
+    }
+
+
+def save_summary(path, summary):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,226 @@
+"""
+Headless rendering of the diagram: SvgWriter has MxGraphWriter's begin/cell/end interface, so
+generate_scheme.write_drawio draws the very cells it would write to draw.io (same geometry, styles, legend,
+descriptions and edges) as SVG. PNG is the SVG rasterized by cairosvg. Neither needs draw.io or an X server.
+Text metrics are estimated (CHAR_WIDTH em per glyph), so wrapping is close to, not exactly, draw.io's.
+"""
+
+import html
+import math
+import re
+
+try:
+    import cairosvg
+except (ImportError, OSError):  # OSError: the package is installed but libcairo is not
+    cairosvg = None
+
+FORMATS = ("svg", "png")
+MEDIA_TYPES = {"svg": "image/svg+xml", "png": "image/png"}
+FONT_FAMILY = "Helvetica, Arial, sans-serif"
+CHAR_WIDTH = 0.6  # average glyph width in em
+LINE_HEIGHT = 1.2
+CANVAS_PADDING = 40
+PNG_MAX_SIDE = 8000  # larger canvases are scaled down so one PNG stays within a few hundred MB to rasterize
+
+BR_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+TAG_RE = re.compile(r"<[^>]+>")
+BACKGROUND_RE = re.compile(r"background-color:\s*(#[0-9a-fA-F]{3,8})")
+
+
+class RenderError(Exception):
+    pass
+
+
+def parse_style(style):
+    # "text;fontSize=10;shape=step" -> {"shape": "text", "fontSize": "10"}; later keys win, as in draw.io
+    values = {}
+    for item in (style or "").split(";"):
+        key, sep, value = item.partition("=")
+        if sep:
+            values[key] = value
+        elif key:
+            values.setdefault("shape", key)
+    return values
+
+
+def label_lines(value):
+    # draw.io HTML label -> [(plain text, bold)], one entry per <br>
+    return [(html.unescape(TAG_RE.sub("", part)), "<b>" in part) for part in BR_RE.split(value or "")]
+
+
+def wrap_line(text, width, font_size):
+    # Greedy word wrap to the box width; words longer than a line (file paths) are cut
+    limit = max(1, int(width / (font_size * CHAR_WIDTH)))
+    lines = []
+    current = ""
+    for word in text.split(" "):
+        while len(word) > limit:
+            if current:
+                lines.append(current)
+                current = ""
+            lines.append(word[:limit])
+            word = word[limit:]
+        candidate = f"{current} {word}" if current else word
+        if len(candidate) > limit:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    lines.append(current)
+    return lines
+
+
+def edge_points(source_box, target_box, style):
+    # Orthogonal route: leave the source perpendicular to its side, turn once halfway, enter the target
+    exit_x, exit_y = float(style.get("exitX", 0.5)), float(style.get("exitY", 0.5))
+    entry_x, entry_y = float(style.get("entryX", 0.5)), float(style.get("entryY", 0.5))
+    sx, sy, sw, sh = source_box
+    tx, ty, tw, th = target_box
+    start = (sx + sw * exit_x, sy + sh * exit_y)
+    end = (tx + tw * entry_x, ty + th * entry_y)
+    if exit_y in (0.0, 1.0) and exit_x not in (0.0, 1.0):
+        middle = (start[1] + end[1]) / 2
+        return [start, (start[0], middle), (end[0], middle), end]
+    middle = (start[0] + end[0]) / 2
+    return [start, (middle, start[1]), (middle, end[1]), end]
+
+
+def _number(value):
+    return f"{value:.1f}".rstrip("0").rstrip(".")
+
+
+def _attr(value):
+    return html.escape(str(value), quote=True)
+
+
+class SvgWriter:
+    # Collects cells like MxGraphWriter and writes one SVG document on end(): the canvas size is only known
+    # once every cell is in. Children of a container (the legend) are positioned relative to it, as in draw.io
+    def __init__(self, fh):
+        self.fh = fh
+        self.cells_written = 0
+        self.boxes = {}
+        self.parts = []
+        self.markers = {}
+        self.bounds = [math.inf, math.inf, -math.inf, -math.inf]
+
+    def begin(self, **attrs):
+        pass
+
+    def cell(self, id, value=None, style=None, vertex=None, edge=None, parent=None, source=None, target=None,
+             geometry=None, **attrs):
+        self.cells_written += 1
+        if vertex and geometry:
+            self._vertex(id, value, parse_style(style), parent, geometry)
+        elif edge:
+            self._edge(value, parse_style(style), source, target)
+
+    def _extend(self, x, y, width, height):
+        self.bounds = [min(self.bounds[0], x), min(self.bounds[1], y),
+                       max(self.bounds[2], x + width), max(self.bounds[3], y + height)]
+
+    def _vertex(self, cell_id, value, style, parent, geometry):
+        x, y, width, height = (float(geometry.get(key, 0)) for key in ("x", "y", "width", "height"))
+        if parent in self.boxes:
+            x += self.boxes[parent][0]
+            y += self.boxes[parent][1]
+        self.boxes[cell_id] = (x, y, width, height)
+        self._extend(x, y, width, height)
+        if not style and not value:
+            return  # plain container
+        shape = style.get("shape", "rectangle")
+        fill = style.get("fillColor", "none" if shape == "text" else "#ffffff")
+        stroke = style.get("strokeColor", "none" if shape == "text" else "#000000")
+        paint = (f' fill="{_attr(fill)}" stroke="{_attr(stroke)}" stroke-width="{_attr(style.get("strokeWidth", "1"))}"'
+                 f' opacity="{float(style.get("opacity", 100)) / 100:g}"')
+        if shape == "step":
+            tip = min(width * 0.2, height / 2)
+            points = [(x, y), (x + width - tip, y), (x + width, y + height / 2), (x + width - tip, y + height),
+                      (x, y + height), (x + tip, y + height / 2)]
+            self.parts.append(f'<polygon points="{" ".join(f"{_number(px)},{_number(py)}" for px, py in points)}"{paint}/>')
+        elif shape == "folder":
+            tab_width = float(style.get("tabWidth", 40))
+            tab_height = float(style.get("tabHeight", 14))
+            self.parts.append(
+                f'<path d="M{_number(x)},{_number(y)} h{_number(tab_width)} v{_number(tab_height)} '
+                f'H{_number(x + width)} V{_number(y + height)} H{_number(x)} Z"{paint}/>')
+        elif shape != "text" or fill != "none" or stroke != "none":
+            radius = min(width, height) * 0.15 if style.get("rounded") == "1" else 0
+            self.parts.append(f'<rect x="{_number(x)}" y="{_number(y)}" width="{_number(width)}" '
+                              f'height="{_number(height)}" rx="{_number(radius)}"{paint}/>')
+        if value:
+            self._label(value, style, x, y, width, height)
+
+    def _label(self, value, style, x, y, width, height):
+        font_size = float(style.get("fontSize", 11))
+        lines = label_lines(value)
+        if style.get("whiteSpace") == "wrap":
+            lines = [(part, bold) for text, bold in lines for part in wrap_line(text, width - 4, font_size)]
+        max_lines = max(1, int(height // (font_size * LINE_HEIGHT)))
+        if style.get("shape") != "text" and len(lines) > max_lines:
+            lines = lines[:max_lines - 1] + [(lines[max_lines - 1][0][:-1] + "…", lines[max_lines - 1][1])]
+        align = style.get("align", "center")
+        anchor, text_x = {"left": ("start", x + 2), "right": ("end", x + width - 2)}.get(align, ("middle", x + width / 2))
+        block = len(lines) * font_size * LINE_HEIGHT
+        top = {"top": y + 2, "bottom": y + height - block - 2}.get(style.get("verticalAlign"), y + (height - block) / 2)
+        background = BACKGROUND_RE.search(value)
+        bold_style = int(style.get("fontStyle", 0)) & 1
+        for i, (text, bold) in enumerate(lines):
+            baseline = top + (i + 1) * font_size * LINE_HEIGHT - font_size * 0.25
+            if background and text:
+                text_width = len(text) * font_size * CHAR_WIDTH + 4
+                left = {"start": text_x - 2, "end": text_x - text_width + 2}.get(anchor, text_x - text_width / 2)
+                self.parts.append(f'<rect x="{_number(left)}" y="{_number(baseline - font_size)}" '
+                                  f'width="{_number(text_width)}" height="{_number(font_size * LINE_HEIGHT)}" '
+                                  f'fill="{background.group(1)}"/>')
+            weight = ' font-weight="bold"' if bold or bold_style else ""
+            color = _attr(style.get("fontColor", "#000000"))
+            self.parts.append(f'<text x="{_number(text_x)}" y="{_number(baseline)}" font-size="{_number(font_size)}" '
+                              f'text-anchor="{anchor}" fill="{color}"{weight}>{html.escape(text, quote=False)}</text>')
+
+    def _edge(self, value, style, source, target):
+        if source not in self.boxes or target not in self.boxes:
+            return
+        points = edge_points(self.boxes[source], self.boxes[target], style)
+        color = style.get("strokeColor", "#000000")
+        marker = self.markers.setdefault(color, f"arrow{len(self.markers)}")
+        path = " ".join(f"{'M' if i == 0 else 'L'}{_number(px)},{_number(py)}" for i, (px, py) in enumerate(points))
+        self.parts.append(f'<path d="{path}" fill="none" stroke="{_attr(color)}" '
+                          f'stroke-width="{_attr(style.get("strokeWidth", "1"))}" marker-end="url(#{marker})"/>')
+        if value:
+            label_x, label_y = (points[1][0] + points[2][0]) / 2, (points[1][1] + points[2][1]) / 2
+            self.parts.append(f'<text x="{_number(label_x)}" y="{_number(label_y)}" font-size="10" '
+                              f'text-anchor="middle">{html.escape(str(value), quote=False)}</text>')
+
+    def end(self):
+        if self.bounds[0] == math.inf:
+            self.bounds = [0, 0, 0, 0]
+        left, top = self.bounds[0] - CANVAS_PADDING, self.bounds[1] - CANVAS_PADDING
+        width = self.bounds[2] - self.bounds[0] + 2 * CANVAS_PADDING
+        height = self.bounds[3] - self.bounds[1] + 2 * CANVAS_PADDING
+        self.fh.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{_number(width)}" height="{_number(height)}" '
+                      f'viewBox="{_number(left)} {_number(top)} {_number(width)} {_number(height)}" '
+                      f'font-family="{FONT_FAMILY}">\n<defs>\n')
+        for color, marker in self.markers.items():
+            self.fh.write(f'<marker id="{marker}" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" '
+                          f'markerHeight="8" orient="auto-start-reverse"><path d="M0,0 L10,5 L0,10 Z" '
+                          f'fill="{_attr(color)}"/></marker>\n')
+        self.fh.write(f'</defs>\n<rect x="{_number(left)}" y="{_number(top)}" width="{_number(width)}" '
+                      f'height="{_number(height)}" fill="#ffffff"/>\n')
+        for part in self.parts:
+            self.fh.write(part)
+            self.fh.write("\n")
+        self.fh.write("</svg>\n")
+
+
+def render_image(svg, image_format="svg"):
+    # SVG text -> image bytes in the requested format
+    if image_format == "svg":
+        return svg.encode("utf-8")
+    if image_format != "png":
+        raise RenderError(f"unknown image format {image_format!r}; expected one of: {', '.join(FORMATS)}")
+    if cairosvg is None:
+        raise RenderError("PNG output needs the cairosvg package and the cairo library")
+    match = re.search(r'width="([\d.]+)" height="([\d.]+)"', svg)
+    scale = min(1.0, PNG_MAX_SIDE / max(float(match.group(1)), float(match.group(2)), 1.0)) if match else 1.0
+    return cairosvg.svg2png(bytestring=svg.encode("utf-8"), scale=scale)
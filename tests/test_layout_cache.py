@@ -0,0 +1,48 @@
+import copy
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+from generate_scheme import generate  # noqa: E402
+from synthetic_manifest import synthetic_manifest  # noqa: E402
+
+
+def node_geometry(path):
+    # Model/source cells by label (cell ids are positional and shift when a node is added) -> (x, y)
+    geometry = {}
+    for cell in ET.parse(path).iter("mxCell"):
+        value = cell.get("value") or ""
+        if cell.get("vertex") == "1" and "<br>" in value and cell.get("id", "").startswith("id"):
+            box = cell.find("mxGeometry")
+            geometry[value] = (box.get("x"), box.get("y"))
+    return geometry
+
+
+def test_unchanged_nodes_keep_canvas_coordinates(tmp_path):
+    manifest = synthetic_manifest(models=60, description_words=(0, 0), seed=1)
+    sidecar = str(tmp_path / "layout.json.gz")
+    first = str(tmp_path / "first.xml")
+    generate(manifest, first, layout="layered", layout_cache=sidecar)
+
+    # A new mart on top of one existing model: only it and its parent change their neighbourhood
+    parent = next(key for key in manifest["nodes"] if key.startswith("model."))
+    grown = copy.deepcopy(manifest)
+    grown["nodes"]["model.bench_project.fct_new_model"] = {
+        "resource_type": "model", "unique_id": "model.bench_project.fct_new_model", "name": "fct_new_model",
+        "package_name": "bench_project", "original_file_path": "models/fct/fct_new_model.sql",
+        "path": "fct/fct_new_model.sql", "depends_on": {"nodes": [parent], "macros": []},
+        "config": {"materialized": "table", "tags": []}, "tags": [], "fqn": ["bench_project", "fct_new_model"],
+    }
+    second = str(tmp_path / "second.xml")
+    generate(grown, second, layout="layered", layout_cache=sidecar)
+
+    before, after = node_geometry(first), node_geometry(second)
+    changed = {label for label in after if label.startswith(("fct_new_model<br>", parent.rsplit(".", 1)[-1] + "<br>"))}
+    assert len(after) == len(before) + 1
+    unchanged = [label for label in before if label not in changed]
+    assert len(unchanged) == len(before) - 1
+    moved = [label for label in unchanged if before[label] != after[label]]
+    assert moved == []
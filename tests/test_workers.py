@@ -0,0 +1,30 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from workers import WarmPool  # noqa: E402
+
+
+def test_timeout_kills_only_the_offending_worker():
+    async def scenario():
+        pool = WarmPool(workers=2)
+        pool.start()
+        try:
+            pids = set(await asyncio.gather(pool.call(os.getpid, (), 30), pool.call(os.getpid, (), 30)))
+            slow = asyncio.create_task(pool.call(time.sleep, (30,), 1))
+            healthy = asyncio.create_task(pool.call(time.sleep, (3,), 30))
+            with pytest.raises(asyncio.TimeoutError):
+                await slow
+            # Finishes normally although the other job timed out while it was running
+            assert await healthy is None
+            after = {worker.process.pid for worker in pool.processes}
+            assert len(after) == 2
+            assert len(pids & after) == 1
+        finally:
+            pool.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,157 @@
+"""
+Laid-out diagram in SQLite for viewport queries: TileWriter has MxGraphWriter's begin/cell/end interface, so
+generate_scheme.write_drawio stores exactly the cells, styles and edge attachments it would write to draw.io.
+Every cell gets an R*Tree entry over (x, y, zoom): the third axis is the level of detail, so one index lookup
+returns what lies in the viewport and is worth drawing at that zoom. Zoom is screen pixels per diagram unit.
+"""
+
+import json
+import os
+import sqlite3
+import uuid
+
+from svg_render import parse_style, edge_points
+
+STORE_VERSION = 1
+# Smallest zoom each kind of cell is sent at; node text and edge bends are dropped below NODE_TEXT_ZOOM
+MIN_ZOOM = {"node": 0.0, "edge": 0.0, "legend": 0.0, "label": 0.5, "description": 0.8}
+NODE_TEXT_ZOOM = 0.25
+MAX_ZOOM = 1e30
+DEFAULT_LIMIT = 5000
+MAX_LIMIT = 50000
+# Already applied to the stored edge points; dropping them lets edges share a handful of styles
+ATTACHMENT_KEYS = ("exitX", "exitY", "entryX", "entryY")
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE cells (id INTEGER PRIMARY KEY, cell_id TEXT, kind TEXT, value TEXT, style TEXT,
+                    x REAL, y REAL, width REAL, height REAL, points TEXT);
+CREATE VIRTUAL TABLE cell_index USING rtree(id, min_x, max_x, min_y, max_y, min_zoom, max_zoom);
+"""
+
+
+class TileStoreError(Exception):
+    pass
+
+
+def cell_kind(cell_id, style, edge=False):
+    # Relies on write_drawio's cell ids: legend*, text{i}/desc_arrow{i} for descriptions
+    if cell_id.startswith(("legend", "run_legend", "back_link")):
+        return "legend"
+    if cell_id.startswith(("text", "desc_arrow")):
+        return "description"
+    if edge:
+        return "edge"
+    return "label" if style.get("shape") == "text" else "node"
+
+
+class TileWriter:
+    # Rows are collected and inserted in one transaction on end(); the file appears atomically under path
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        self.cells_written = 0
+        self.boxes = {}
+        self.rows = []
+        self.bounds = [float("inf"), float("inf"), float("-inf"), float("-inf")]
+
+    def begin(self, **attrs):
+        pass
+
+    def cell(self, id, value=None, style=None, vertex=None, edge=None, parent=None, source=None, target=None,
+             geometry=None, **attrs):
+        self.cells_written += 1
+        parsed = parse_style(style)
+        if vertex and geometry:
+            x, y, width, height = (float(geometry.get(key, 0)) for key in ("x", "y", "width", "height"))
+            if parent in self.boxes:
+                x += self.boxes[parent][0]
+                y += self.boxes[parent][1]
+            self.boxes[id] = (x, y, width, height)
+            if style or value:
+                self._add(id, cell_kind(id, parsed), value, style, (x, y, width, height), None)
+        elif edge and source in self.boxes and target in self.boxes:
+            points = edge_points(self.boxes[source], self.boxes[target], parsed)
+            xs = [px for px, _ in points]
+            ys = [py for _, py in points]
+            box = (min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+            style = ";".join(item for item in style.split(";") if item.partition("=")[0] not in ATTACHMENT_KEYS)
+            self._add(id, cell_kind(id, parsed, edge=True), value, style, box, points)
+
+    def _add(self, cell_id, kind, value, style, box, points):
+        x, y, width, height = box
+        self.bounds = [min(self.bounds[0], x), min(self.bounds[1], y),
+                       max(self.bounds[2], x + width), max(self.bounds[3], y + height)]
+        self.rows.append((cell_id, kind, value, style, x, y, width, height,
+                          json.dumps([[round(px, 1), round(py, 1)] for px, py in points]) if points else None))
+
+    def end(self):
+        if self.bounds[0] == float("inf"):
+            self.bounds = [0.0, 0.0, 0.0, 0.0]
+        counts = {}
+        for row in self.rows:
+            counts[row[1]] = counts.get(row[1], 0) + 1
+        connection = sqlite3.connect(self.tmp_path)
+        try:
+            connection.executescript(SCHEMA)
+            connection.executemany("INSERT INTO cells VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   ((i, *row) for i, row in enumerate(self.rows, 1)))
+            connection.executemany("INSERT INTO cell_index VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   ((i, x, x + width, y, y + height, MIN_ZOOM[kind], MAX_ZOOM)
+                                    for i, (_, kind, _, _, x, y, width, height, _) in enumerate(self.rows, 1)))
+            meta = {"version": STORE_VERSION, "bounds": self.bounds, "counts": counts, "min_zoom": MIN_ZOOM,
+                    "node_text_zoom": NODE_TEXT_ZOOM}
+            connection.executemany("INSERT INTO meta VALUES (?, ?)",
+                                   ((key, json.dumps(value)) for key, value in meta.items()))
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(self.tmp_path, self.path)
+        self.rows = []
+
+
+def _connect(path):
+    if not os.path.exists(path):
+        raise TileStoreError(f"tile store not found: {path}")
+    # Read-only: a store is written once by TileWriter and then only queried
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def store_meta(path):
+    connection = _connect(path)
+    try:
+        return {key: json.loads(value) for key, value in connection.execute("SELECT key, value FROM meta")}
+    finally:
+        connection.close()
+
+
+def query_cells(path, x0, y0, x1, y1, zoom, limit=DEFAULT_LIMIT):
+    # Cells intersecting the box that are visible at this zoom, in drawing order (as written by write_drawio).
+    # Zoomed out, node text is left out and edges become straight lines between their end points
+    if x1 < x0 or y1 < y0 or zoom <= 0:
+        raise TileStoreError("expected x0 <= x1, y0 <= y1 and zoom > 0")
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    connection = _connect(path)
+    try:
+        rows = connection.execute(
+            "SELECT c.cell_id, c.kind, c.value, c.style, c.x, c.y, c.width, c.height, c.points "
+            "FROM cell_index i JOIN cells c ON c.id = i.id "
+            "WHERE i.max_x >= ? AND i.min_x <= ? AND i.max_y >= ? AND i.min_y <= ? AND i.min_zoom <= ? "
+            "ORDER BY c.id LIMIT ?", (x0, x1, y0, y1, zoom, limit + 1)).fetchall()
+    finally:
+        connection.close()
+    detailed = zoom >= NODE_TEXT_ZOOM
+    # Thousands of cells share a few dozen styles: each is sent once, cells refer to it by position
+    styles = {}
+    cells = []
+    for cell_id, kind, value, style, x, y, width, height, points in rows[:limit]:
+        cell = {"id": cell_id, "kind": kind, "style": styles.setdefault(style, len(styles))}
+        if points:
+            points = json.loads(points)
+            cell["points"] = points if detailed else [points[0], points[-1]]
+        else:
+            cell.update(x=x, y=y, width=width, height=height)
+        if value and (detailed or kind != "node"):
+            cell["value"] = value
+        cells.append(cell)
+    return {"styles": list(styles), "cells": cells, "truncated": len(rows) > limit, "zoom": zoom, "detailed": detailed}
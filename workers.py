@@ -0,0 +1,131 @@
+import asyncio
+import contextlib
+import io
+import logging
+import multiprocessing
+from concurrent.futures.process import BrokenProcessPool
+
+# Imported once in the forkserver; every worker forked from it starts with these already loaded
+PRELOAD_MODULES = ["generate_scheme", "compact_graph", "numpy"]
+
+
+def _warm_up():
+    import generate_scheme  # noqa: F401
+    try:
+        import pygraphviz  # noqa: F401
+    except ImportError:
+        pass
+
+
+def _run_generate(input_path, output_path, options):
+    import generate_scheme
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        generate_scheme.generate(input_path, output_path, **options)
+    return log.getvalue()
+
+
+def _serve(connection):
+    # Worker loop: one (function, args) task at a time until the pipe is closed
+    _warm_up()
+    while True:
+        try:
+            function, args = connection.recv()
+        except EOFError:
+            return
+        try:
+            reply = ("ok", function(*args))
+        except Exception as e:
+            reply = ("error", e)
+        try:
+            connection.send(reply)
+        except Exception:  # the exception itself does not pickle
+            connection.send(("error", RuntimeError(f"{type(reply[1]).__name__}: {reply[1]}")))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,))
+        self.process.start()
+        child.close()
+        self.jobs = 0
+
+    def retire(self):
+        # Idle worker: closing the pipe ends its loop
+        self.connection.close()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join(timeout=1)
+
+
+class WarmPool:
+    # Generator processes that stay alive between jobs, one job at a time each. A worker is replaced after
+    # max_jobs_per_worker jobs to cap memory growth; a timed-out or crashed one is killed and replaced alone,
+    # so jobs running in the other workers are not affected
+    def __init__(self, workers=2, max_jobs_per_worker=50):
+        self.workers = workers
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.context = multiprocessing.get_context("forkserver")
+        self.context.set_forkserver_preload(PRELOAD_MODULES)
+        self.idle = None
+        self.processes = set()
+
+    def start(self):
+        # Fork the workers now rather than on the first request
+        self.idle = asyncio.Queue()
+        for _ in range(self.workers):
+            self._spawn()
+
+    def stop(self):
+        for worker in list(self.processes):
+            worker.kill()
+        self.processes.clear()
+        self.idle = None
+
+    def _spawn(self):
+        worker = _Worker(self.context)
+        self.processes.add(worker)
+        self.idle.put_nowait(worker)
+
+    def _replace(self, worker, retire=False):
+        self.processes.discard(worker)
+        if retire:
+            worker.retire()
+        else:
+            # terminate() + join() may wait up to a second: reaped in a thread, not on the event loop
+            asyncio.get_running_loop().run_in_executor(None, worker.kill)
+        if self.idle is not None:
+            self._spawn()
+
+    async def call(self, function, args, timeout):
+        # function(*args) in an idle worker; function and its result must pickle
+        worker = await self.idle.get()
+        loop = asyncio.get_running_loop()
+        try:
+            worker.connection.send((function, args))
+            status, value = await asyncio.wait_for(loop.run_in_executor(None, worker.connection.recv), timeout)
+        except asyncio.TimeoutError:
+            # The job cannot be cancelled inside the worker: only this worker is killed
+            logging.warning(f"Процесс генератора {worker.process.pid} остановлен по таймауту")
+            self._replace(worker)
+            raise
+        except (EOFError, OSError) as e:
+            self._replace(worker)
+            raise BrokenProcessPool(f"generator process {worker.process.pid} exited "
+                                    f"with code {worker.process.exitcode}") from e
+        except BaseException:
+            self._replace(worker)
+            raise
+        worker.jobs += 1
+        if worker.jobs >= self.max_jobs_per_worker:
+            self._replace(worker, retire=True)
+        else:
+            self.idle.put_nowait(worker)
+        if status == "error":
+            raise value
+        return value
+
+    async def run(self, input_path, output_path, options, timeout):
+        return await self.call(_run_generate, (input_path, output_path, options), timeout)